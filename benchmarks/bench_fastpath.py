@@ -0,0 +1,64 @@
+'''
+Calls per second of `hirasawa_validate` through pydantic's `validate_call` vs `fast=True`.
+`light` has cheap argument checks, so the argument model pydantic goes through dominates,
+`heavy` also reduces an array with `tensorange`, which both paths pay the same.
+The variants take turns, so drifting machine load is spread over all of them.
+
+    python -m benchmarks.bench_fastpath
+'''
+from timeit import timeit
+from typing import Annotated as Annt
+
+import numpy as np
+from numpy.typing import NDArray
+from sympy.abc import W, H
+
+from validators import hirasawa_validate, tensorange, tensorshape
+
+
+def light(
+    mat: Annt[NDArray[np.float64], tensorshape[W, H]],
+    steps: int,
+    name: str = '',
+):
+    return None
+
+
+def heavy(
+    mat1: Annt[NDArray[np.float64], tensorshape[2*W, 2*H]],
+    mat2: Annt[NDArray[np.float64], tensorshape[H, W], tensorange[0:1]],
+    scale: float = 1.0,
+):
+    return None
+
+
+def calls_per_second(rows: list[tuple[str, object]], number: int = 20000, repeat: int = 7) -> dict[str, float]:
+    best = {name: float('inf') for name, _ in rows}
+    for _ in range(repeat):
+        for name, call in rows:
+            best[name] = min(best[name], timeit(call, number=number))  # type: ignore
+    return {name: number / seconds for name, seconds in best.items()}
+
+
+def main() -> None:
+    mat = np.zeros((8, 6))
+    mat1 = np.zeros((8, 6))
+    mat2 = np.zeros((3, 4))
+    cases = [
+        ('light', light, lambda func: lambda: func(mat, 10, name='run')),
+        ('heavy', heavy, lambda func: lambda: func(mat1, mat2, scale=2.0)),
+    ]
+    for title, func, call in cases:
+        rows = [
+            ('undecorated', call(func)),
+            ('validate_call path', call(hirasawa_validate(func))),
+            ('fast path', call(hirasawa_validate(func, fast=True))),
+            ('fast path + shape cache', call(hirasawa_validate(func, fast=True, shape_cache=16))),
+        ]
+        print(title)
+        for name, rate in calls_per_second(rows).items():
+            print(f'  {name:<26}{rate:>14,.0f} calls/s')
+
+
+if __name__ == '__main__':
+    main()
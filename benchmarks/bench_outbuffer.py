@@ -0,0 +1,51 @@
+'''
+Calls per second of a function allocating its output vs `out` allocated by `hirasawa_validate`,
+new on every call or from `out_pool`.
+
+    python -m benchmarks.bench_outbuffer
+'''
+from timeit import repeat
+from typing import Annotated as Annt
+
+import numpy as np
+from numpy.typing import NDArray
+from sympy.abc import W, H
+
+from validators import hirasawa_validate, tensorshape
+
+
+def allocating(mat: Annt[NDArray[np.float64], tensorshape[W, H]]):
+    out = np.empty((2 * mat.shape[0], mat.shape[1]))
+    np.multiply(mat, 2.0, out=out[:mat.shape[0]])
+    np.multiply(mat, 3.0, out=out[mat.shape[0]:])
+    return out
+
+
+def with_out(
+    mat: Annt[NDArray[np.float64], tensorshape[W, H]],
+    out: NDArray[np.float64] | None = None,
+) -> Annt[NDArray[np.float64], tensorshape[2*W, H]]:
+    np.multiply(mat, 2.0, out=out[:mat.shape[0]])
+    np.multiply(mat, 3.0, out=out[mat.shape[0]:])
+    return out
+
+
+def calls_per_second(call, number: int = 5000) -> float:
+    return number / min(repeat(call, number=number, repeat=5))
+
+
+def main() -> None:
+    for size in (64, 1024):
+        mat = np.random.rand(size, size)
+        rows = [
+            ('allocated in the body', hirasawa_validate(allocating, fast=True)),
+            ('out allocated per call', hirasawa_validate(with_out, fast=True)),
+            ('out from out_pool', hirasawa_validate(with_out, fast=True, out_pool=4)),
+        ]
+        for name, decorated in rows:
+            number = 5000 if size <= 64 else 100
+            print(f'{size}x{size} {name:<26}{calls_per_second(lambda: decorated(mat), number):>12,.0f} calls/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+'''
+Calls per second of `validate_call` over a function `sig_inject` generated,
+vs the same signature patched onto a `*args, **kwargs` function, and time to decorate.
+
+    python -m benchmarks.bench_sig_inject
+'''
+from inspect import signature
+from timeit import repeat
+
+from pydantic import validate_call
+
+from sig_inject import sig_inject
+
+
+SPEC: list = ['a', '/', ('b', int), ('c', float, 1.0), '*', ('d', str, 'x')]
+
+
+def target(a, b, c=1.0, *, d='x'):
+    return None
+
+
+def patched(func):
+    # what `sig_inject` did before generating functions
+    injected = sig_inject(SPEC, None)(func)
+
+    def forward(*args, **kwargs):
+        return func(*args, **kwargs)
+    forward.__signature__ = signature(injected)  # type: ignore
+    forward.__annotations__ = dict(injected.__annotations__)
+    return forward
+
+
+def calls_per_second(call, number: int = 50000) -> float:
+    return number / min(repeat(call, number=number, repeat=5))
+
+
+def main() -> None:
+    rows = [
+        ('undecorated', target),
+        ('validate_call, patched', validate_call(patched(target))),
+        ('validate_call, generated', validate_call(sig_inject(SPEC, None)(target))),
+    ]
+    for name, func in rows:
+        print(f'{name:<28}{calls_per_second(lambda: func(0, 1, 2.0, d="y")):>14,.0f} calls/s')
+    for name, decorate in [
+        ('sig_inject, cached spec', lambda: sig_inject(SPEC, None)(target)),
+        ('validate_call + sig_inject', lambda: validate_call(sig_inject(SPEC, None)(target))),
+    ]:
+        print(f'{name:<28}{min(repeat(decorate, number=200, repeat=5)) / 200 * 1e6:>14,.1f} us')
+
+
+if __name__ == '__main__':
+    main()
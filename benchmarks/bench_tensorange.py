@@ -0,0 +1,60 @@
+'''
+tensorange on 10^8 element float32 / float64 arrays.
+
+    python -m benchmarks.bench_tensorange [n_elements]
+
+"separate" is what tensorange used to do: `value.min()` then `value.max()`, each a full pass
+over the array, and again for the error message on failure (up to 4 passes).
+"fused" is `reductions.minmax`, one pass over memory with NaN / Inf detection folded in.
+'''
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from validators.reductions import minmax
+
+
+def separate(value: np.ndarray, fail: bool) -> int:
+    passes = 2
+    value.min(), value.max()
+    if fail:
+        value.min(), value.max()
+        passes += 2
+    return passes
+
+
+def fused(value: np.ndarray, fail: bool) -> int:
+    minmax(value)
+    return 1
+
+
+def best_of(func, value: np.ndarray, fail: bool, repeat: int = 3) -> tuple[float, int]:
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        passes = func(value, fail)
+        times.append(perf_counter() - start)
+    return min(times), passes
+
+
+def main() -> None:
+    n = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10**8
+    for dtype in (np.float32, np.float64):
+        value = np.random.default_rng(0).random(n, dtype=dtype)
+        gb = value.nbytes / 1e9
+        print(f'{np.dtype(dtype).name} x {n:.0e} ({gb:.2f} GB)')
+        for fail in (False, True):
+            old_time, old_passes = best_of(separate, value, fail)
+            new_time, new_passes = best_of(fused, value, fail)
+            label = 'failing check' if fail else 'passing check'
+            print(
+                f'  {label}: separate {old_time * 1e3:8.1f} ms, {old_passes * gb:5.2f} GB read | '
+                f'fused {new_time * 1e3:8.1f} ms, {new_passes * gb:5.2f} GB read | '
+                f'saved {(old_passes - new_passes) * gb:5.2f} GB'
+            )
+        del value
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+'''
+Per-call cost of the README `2*W, 2*H` / `H, W` example.
+
+    python -m benchmarks.bench_tensorshape
+
+"sympy storage" replays what every call used to do, a copy of the `SympyStorage.__setitem__`
+that simplified and solved every dimension with sympy, "compiled" runs the constraints
+`tensorshape` lowers at decoration time.
+'''
+from timeit import repeat
+from typing import Annotated as Annt
+
+import numpy as np
+import sympy as sp
+from numpy.typing import NDArray
+from sympy.abc import W, H
+
+from validators import hirasawa_validate, tensorshape
+from validators.shapecompiler import compile_shape
+
+
+SPEC1 = (2*W, 2*H)
+SPEC2 = (H, W)
+SHAPE1 = (8, 6)
+SHAPE2 = (3, 4)
+
+
+def _sympy_assign(namespace: dict[str, float], key: sp.Expr, value: int) -> None:
+    # `SympyStorage.__setitem__` of an expression before the constraints were compiled
+    value = float(value)
+    expr = sp.simplify(key - value).subs(namespace)
+    symbols = expr.free_symbols
+    if len(symbols) == 0:
+        ans = float(expr)
+        if abs(ans) < 1e-10: return
+        raise ValueError(f"{key} is already assigned to {value+ans}")
+    if len(symbols) == 1:
+        symbol = next(iter(symbols))
+        if symbol in namespace:
+            if namespace[str(symbol)] == float(expr): return
+            raise ValueError(f"{symbol} is already assigned to {namespace[str(symbol)]}")
+        solve = sp.solve(expr, symbol)
+        namespace[str(symbol)] = float(solve[0])
+    else:
+        raise ValueError(f"Error expresion {key} (To many unsolved symbols: {symbols})")
+
+
+def sympy_storage_call() -> None:
+    namespace: dict[str, float] = {}
+    for spec, shape in ((SPEC1, SHAPE1), (SPEC2, SHAPE2)):
+        for required_size, actual_size in zip(spec, shape):
+            _sympy_assign(namespace, required_size, actual_size)
+
+
+COMPILED1 = compile_shape(SPEC1)
+COMPILED2 = compile_shape(SPEC2)
+
+
+def compiled_call() -> None:
+    bindings: dict[str, int] = {}
+    for constraints, shape in ((COMPILED1, SHAPE1), (COMPILED2, SHAPE2)):
+        for constraint, actual_size in zip(constraints, shape):
+            constraint.check(bindings, actual_size)
+
+
+def plain(mat1, mat2):
+    return None
+
+
+@hirasawa_validate
+def decorated(
+    mat1: Annt[NDArray[np.float64], tensorshape[2*W, 2*H]],
+    mat2: Annt[NDArray[np.float64], tensorshape[H, W]],
+):
+    return None
+
+
+def per_call_us(stmt, number: int) -> float:
+    return min(repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+
+def main() -> None:
+    mat1 = np.zeros(SHAPE1)
+    mat2 = np.zeros(SHAPE2)
+    rows = [
+        ('sympy storage (before)', per_call_us(sympy_storage_call, 20)),
+        ('compiled constraints (after)', per_call_us(compiled_call, 20000)),
+        ('undecorated call', per_call_us(lambda: plain(mat1, mat2), 20000)),
+        ('hirasawa_validate call', per_call_us(lambda: decorated(mat1, mat2), 20000)),
+    ]
+    for name, cost in rows:
+        print(f'{name:<32}{cost:>12.2f} us/call')
+    print(f'{"constraint speedup":<32}{rows[0][1] / rows[1][1]:>12.0f} x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+'''
+Validation overhead across constraint kinds, written to a JSON file and compared against an earlier run.
+
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --output new.json --compare bench.json --threshold 0.1
+
+Cases:
+- `overhead/<spec>`: ns a `hirasawa_validate` call adds over the undecorated call,
+  for integer, slice, `'*'` and symbolic `tensorshape` specs,
+- `tensorange/<n>`: GB/s of the range check of an n element float64 array,
+- `tensorange/cached`: ns of the range check of an array over `bytes` checked before, with `cache=True`,
+- `nrange/call`: ns `nrange` adds to a call,
+- `decorate`: ms to decorate a function, schema build included.
+
+`--compare` prints the change of every case and exits with 1 when some case got worse than `threshold`,
+a fraction of the baseline. Timings are the best of several repeats, noisy machines need a larger threshold.
+'''
+import argparse
+import json
+import platform
+import sys
+from timeit import repeat
+from typing import Annotated as Annt, Any, Callable
+
+import numpy as np
+from numpy.typing import NDArray
+from sympy.abc import W, H
+
+from validators import hirasawa_validate, nrange, tensorange, tensorshape
+
+
+type Result = dict[str, Any]  # {'value': float, 'unit': str, 'better': 'lower' | 'higher'}
+
+
+def _seconds_per_call(call: Callable[[], Any], number: int, repeats: int = 5) -> float:
+    return min(repeat(call, number=number, repeat=repeats)) / number
+
+
+def _plain(a, b):
+    return None
+
+
+SHAPE_SPECS: dict[str, tuple[Any, Any]] = {
+    'int': (tensorshape[8, 6], tensorshape[3, 4]),
+    'slice': (tensorshape[4:16, :], tensorshape[1:4, 2:]),
+    'any': (tensorshape['*', '*'], tensorshape['*', 4]),
+    'symbolic': (tensorshape[2*W, 2*H], tensorshape[H, W]),
+}
+
+
+def _shape_func(spec1: Any, spec2: Any) -> Callable:
+    def func(
+        a: Annt[NDArray[np.float64], spec1],
+        b: Annt[NDArray[np.float64], spec2],
+    ):
+        return None
+    return func
+
+
+def bench_overhead(number: int) -> dict[str, Result]:
+    a, b = np.zeros((8, 6)), np.zeros((3, 4))
+    baseline = _seconds_per_call(lambda: _plain(a, b), number)
+    results = {}
+    for name, specs in SHAPE_SPECS.items():
+        for fast in (False, True):
+            func = hirasawa_validate(_shape_func(*specs), fast=fast)
+            elapsed = _seconds_per_call(lambda: func(a, b), number)
+            results[f'overhead/{name}{"/fast" if fast else ""}'] = {
+                'value': (elapsed - baseline) * 1e9, 'unit': 'ns', 'better': 'lower',
+            }
+    return results
+
+
+def bench_tensorange(sizes: list[int]) -> dict[str, Result]:
+    validator = tensorange[0:1]
+    results = {}
+    for size in sizes:
+        value = np.random.rand(size)
+        number = max(1, 10**7 // size)
+        elapsed = _seconds_per_call(lambda: validator.validate(value), number)
+        results[f'tensorange/{size}'] = {'value': value.nbytes / elapsed / 1e9, 'unit': 'GB/s', 'better': 'higher'}
+    cached = tensorange(cache=True)[0:1]
+    value = np.frombuffer(np.random.rand(sizes[-1]).tobytes())  # over a read-only buffer
+    cached.validate(value)
+    elapsed = _seconds_per_call(lambda: cached.validate(value), 10000)
+    results['tensorange/cached'] = {'value': elapsed * 1e9, 'unit': 'ns', 'better': 'lower'}
+    return results
+
+
+def bench_nrange(number: int) -> dict[str, Result]:
+    def plain(x: float, y: float):
+        return None
+
+    def ranged(x: Annt[float, nrange[0:1]], y: Annt[float, nrange[0:1]]):
+        return None
+
+    unranged = hirasawa_validate(plain, fast=True)
+    func = hirasawa_validate(ranged, fast=True)
+    baseline = _seconds_per_call(lambda: unranged(0.5, 0.5), number)
+    elapsed = _seconds_per_call(lambda: func(0.5, 0.5), number)
+    return {'nrange/call': {'value': (elapsed - baseline) / 2 * 1e9, 'unit': 'ns', 'better': 'lower'}}
+
+
+def bench_decorate(number: int) -> dict[str, Result]:
+    func = _shape_func(*SHAPE_SPECS['symbolic'])
+    elapsed = _seconds_per_call(lambda: hirasawa_validate(func), number, repeats=3)
+    return {'decorate': {'value': elapsed * 1e3, 'unit': 'ms', 'better': 'lower'}}
+
+
+def run(quick: bool = False) -> dict[str, Any]:
+    number = 2000 if quick else 20000
+    sizes = [10**3, 10**5] if quick else [10**3, 10**5, 10**7]
+    results: dict[str, Result] = {}
+    results |= bench_overhead(number)
+    results |= bench_tensorange(sizes)
+    results |= bench_nrange(number)
+    results |= bench_decorate(5 if quick else 20)
+    return {
+        'machine': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+        },
+        'results': results,
+    }
+
+
+def compare(current: dict[str, Result], baseline: dict[str, Result], threshold: float) -> list[str]:
+    '''
+    Print the change of every case found in both runs, return the names of the regressed ones.
+    '''
+    regressions = []
+    for name, result in current.items():
+        before = baseline.get(name)
+        if before is None or before['value'] == 0:
+            continue
+        change = (result['value'] - before['value']) / abs(before['value'])
+        worse = change if result['better'] == 'lower' else -change
+        flag = ''
+        if worse > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:<24}{before["value"]:>12.2f} -> {result["value"]:>12.2f} {result["unit"]:<5}{change:>+8.1%}{flag}')
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='regression threshold, a fraction of the baseline')
+    parser.add_argument('--quick', action='store_true', help='fewer calls and smaller arrays')
+    args = parser.parse_args(argv)
+    report = run(args.quick)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.compare is None:
+        for name, result in report['results'].items():
+            print(f'{name:<24}{result["value"]:>12.2f} {result["unit"]}')
+        return 0
+    with open(args.compare) as file:
+        baseline = json.load(file)
+    regressions = compare(report['results'], baseline['results'], args.threshold)
+    if regressions:
+        print(f'{len(regressions)} regression(s) above {args.threshold:.0%}: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
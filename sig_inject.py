@@ -1,5 +1,6 @@
 from inspect import signature,  Parameter, Signature, _empty, _ParameterKind
-from functools import wraps
+from keyword import iskeyword
+from typing import Any, Callable, Hashable
 from pydantic import validate_call
 
 
@@ -13,11 +14,13 @@ from pydantic import validate_call
 #     return sig.parameters[list(sig.parameters.keys())[0]]
 
 
+# compiled factories of the generated functions, by spec
+_makers: dict[Hashable, Callable[[Callable], Callable]] = {}
 
-def sig_inject(params: list[str | tuple], ret: type, /):
+
+def _parse(params: list[str | tuple], ret: Any) -> Signature:
     updated_params: list[Parameter] = []
-    __annotations__: dict = {}
-    has_star: bool = False  # whether there is a `*` parameter
+    has_star: bool = False  # whether there is a `*` or `*args` parameter
     for param in params:
         if param == '*':
             has_star = True
@@ -38,6 +41,8 @@ def sig_inject(params: list[str | tuple], ret: type, /):
                 name, annotation, default = param
                 if annotation == '':
                     annotation = _empty
+            else:
+                raise TypeError(f'Invalid parameter: {param}')
         else:
             raise TypeError(f'Invalid parameter: {param}')
         kind: _ParameterKind = Parameter.POSITIONAL_OR_KEYWORD if not has_star else Parameter.KEYWORD_ONLY
@@ -47,27 +52,103 @@ def sig_inject(params: list[str | tuple], ret: type, /):
         elif name.startswith('*'):
             name = name[1:]
             kind = Parameter.VAR_POSITIONAL
+            has_star = True
+        if not name.isidentifier() or iskeyword(name) or name.startswith('_sig_'):
+            raise ValueError(f'Invalid parameter name: {name!r}')
         updated_params.append(Parameter(name, kind, default=default, annotation=annotation))
-        __annotations__[name] = annotation
-    sig = Signature(parameters=updated_params, return_annotation=ret)
-    def decorator(func):
-        func.__signature__ = sig  # type: ignore
-        func.__annotations__ = __annotations__  # type: ignore
-        return func
-    return decorator
+    return Signature(parameters=updated_params, return_annotation=ret)  # checks kinds and defaults are in order
+
+
+def _maker(sig: Signature) -> Callable[[Callable], Callable]:
+    '''
+    Compile `def _sig_make(_sig_target)` returning a function with the parameters of `sig`
+    that passes its arguments on to `_sig_target`, with the same kinds.
+    '''
+    namespace: dict[str, Any] = {}
+    params: list[str] = []
+    args: list[str] = []
+    star = False
+    for i, param in enumerate(sig.parameters.values()):
+        if param.kind == Parameter.KEYWORD_ONLY and not star:
+            params.append('*')
+            star = True
+        if param.kind == Parameter.VAR_POSITIONAL:
+            params.append(f'*{param.name}')
+            args.append(f'*{param.name}')
+            star = True
+        elif param.kind == Parameter.VAR_KEYWORD:
+            params.append(f'**{param.name}')
+            args.append(f'**{param.name}')
+        else:
+            if param.default is _empty:
+                params.append(param.name)
+            else:
+                namespace[f'_sig_d{i}'] = param.default
+                params.append(f'{param.name}=_sig_d{i}')
+            args.append(f'{param.name}={param.name}' if param.kind == Parameter.KEYWORD_ONLY else param.name)
+        if param.kind == Parameter.POSITIONAL_ONLY and all(
+            other.kind != Parameter.POSITIONAL_ONLY for other in list(sig.parameters.values())[i + 1:]
+        ):
+            params.append('/')
+    source = '\n'.join([
+        'def _sig_make(_sig_target):',
+        f'    def injected({", ".join(params)}):',
+        f'        return _sig_target({", ".join(args)})',
+        '    return injected',
+    ])
+    exec(source, namespace)
+    make = namespace['_sig_make']
+    annotations = {name: param.annotation for name, param in sig.parameters.items() if param.annotation is not _empty}
+    if sig.return_annotation is not _empty:
+        annotations['return'] = sig.return_annotation
+
+    def maker(func: Callable) -> Callable:
+        injected = make(func)
+        injected.__annotations__ = dict(annotations)
+        for attr in ('__module__', '__name__', '__qualname__', '__doc__'):
+            setattr(injected, attr, getattr(func, attr, getattr(injected, attr)))
+        # not `__wrapped__` or `__signature__` of a `functools.wraps` target, `inspect` would use them over the spec
+        injected.__dict__.update(
+            (name, value) for name, value in getattr(func, '__dict__', {}).items()
+            if name not in ('__wrapped__', '__signature__')
+        )
+        return injected
+    return maker
+
+
+def sig_inject(params: list[str | tuple], ret: type, /):
+    '''
+    Replace the decorated function by a generated one with the given parameters, which calls it.
+    Parameters are `'name'`, `(name, annotation)` or `(name, annotation, default)`, `'*args'`, `'**kwargs'`,
+    and the markers `'*'` and `'/'`, e.g. `sig_inject(['a', '/', ('b', int, 0), '*', ('c', str)], int)`.
+    `validate_call` and `inspect` see a real function, not a patched `__signature__`,
+    the code of one spec is compiled once and shared by every function decorated with it.
+    '''
+    try:
+        # with the types, so a default of `0` does not share the function of a default of `False`
+        key: Hashable = (tuple((param, tuple(map(type, param)) if isinstance(param, tuple) else None) for param in params), ret)
+        maker = _makers.get(key)
+    except TypeError:  # unhashable annotation or default
+        key, maker = None, None
+    if maker is None:
+        maker = _maker(_parse(params, ret))
+        if key is not None:
+            _makers[key] = maker
+    return maker
 
 
-@validate_call
-@sig_inject(
-    [
-        '*args',
-        '**kwargs'
-    ], int
-)
-def my_func(a, b):
-    print(a, b)
-    return 0
+if __name__ == '__main__':
+    @validate_call
+    @sig_inject(
+        [
+            '*args',
+            '**kwargs'
+        ], int
+    )
+    def my_func(a, b):
+        print(a, b)
+        return 0
 
 
-print(signature(my_func))
-print(my_func(1, 2))
+    print(signature(my_func))
+    print(my_func(1, 2))
@@ -1,18 +1,33 @@
+import asyncio
+import functools
+import inspect
+import multiprocessing
+import pickle
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from functools import wraps
+from pathlib import Path
 from pytest import mark
 import pytest
 
-from pydantic import ValidationError
+from pydantic import TypeAdapter, ValidationError, model_validator
 
-from typing import Annotated as Annt
+from typing import Annotated as Annt, Any, Iterable, Iterator
 
 import numpy as np
 from numpy.typing import NDArray
 
-from sympy.abc import X, Y, Z, W, H
+from sympy.abc import X, Y, Z, W, H, B, F, N
 
 from validators import tensorshape
+from validators import tensorange
+from validators import tensorspec
+from validators import nrange
 from validators import hirasawa_validate
+from validators import current_bindings
+from validators import ShapedModel
 
 
 def should_raise(*exceptions: type[Exception]):
@@ -115,3 +130,1032 @@ def test_func3(shapes):
 
 
 
+
+
+@hirasawa_validate
+def func4(
+    mat1: Annt[NDArray[np.float64],
+        tensorshape[2*W, 2*H],
+    ],
+    mat2: Annt[NDArray[np.float64],
+        tensorshape[H, W*H],
+    ],
+):
+    return mat1.shape, mat2.shape
+
+
+def test_func4():
+    # W*H is not linear, it falls back to a lambdified check
+    assert func4(np.random.rand(6, 4), np.random.rand(2, 6)) == ((6, 4), (2, 6))
+
+
+@mark.parametrize('shapes', [
+    [(5, 4), (2, 5)],  # 2*W = 5 has no non-negative integer solution for W
+    [(6, 4), (2, 5)],  # The 1-th dimension of this tensor-like object must have size 6 (symbol "H*W"), you provide 5
+])
+@should_raise(ValidationError)
+def test_func4_raise(shapes):
+    func4(np.random.rand(*shapes[0]), np.random.rand(*shapes[1]))
+
+
+def test_compiled_constraints_skip_sympy(monkeypatch):
+    import sympy as sp
+    def forbidden(*args, **kwargs):
+        raise AssertionError('sympy should not be called while validating')
+    monkeypatch.setattr(sp, 'simplify', forbidden)
+    monkeypatch.setattr(sp, 'solve', forbidden)
+    assert func4(np.random.rand(6, 4), np.random.rand(2, 6)) == ((6, 4), (2, 6))
+
+
+def test_nonlinear_solution_checked():
+    validator = tensorshape[W**2]
+    validator.validate(np.broadcast_to(np.zeros(1), (10**16,)))
+    with pytest.raises(ValueError):  # sqrt(10**16 + 1) rounds to 10**8 in floats
+        validator.validate(np.broadcast_to(np.zeros(1), (10**16 + 1,)))
+
+
+@hirasawa_validate
+def func5(
+    mat1: Annt[NDArray[np.float64],
+        tensorshape[2*W, 2*H],
+    ],
+    mat2: Annt[NDArray[np.float64],
+        tensorshape[H, W],
+    ],
+):
+    time.sleep(0)  # let other threads run between validation and reading the bindings
+    return dict(current_bindings())
+
+
+def _call_func5(w: int, h: int) -> None:
+    assert func5(np.zeros((2*w, 2*h)), np.zeros((h, w))) == {'W': w, 'H': h}
+    with pytest.raises(ValidationError):
+        func5(np.zeros((2*w, 2*h)), np.zeros((h, w+1)))
+
+
+def test_bindings_threads():
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        futures = [pool.submit(_call_func5, 1 + i % 7, 1 + i % 5) for i in range(400)]
+        for future in futures:
+            future.result()
+    assert current_bindings() is None
+
+
+def test_bindings_asyncio():
+    async def task(i: int) -> None:
+        await asyncio.sleep(0)
+        _call_func5(1 + i % 7, 1 + i % 5)
+        await asyncio.to_thread(_call_func5, 1 + i % 3, 1 + i % 4)
+
+    async def main() -> None:
+        await asyncio.gather(*(task(i) for i in range(100)))
+
+    asyncio.run(main())
+
+
+@hirasawa_validate(shape_cache=2)
+def func6(
+    mat1: Annt[NDArray[np.float64],
+        tensorshape[2*W, 2*H],
+    ],
+    mat2: Annt[NDArray[np.float64],
+        tensorshape[H, W],
+    ],
+):
+    return dict(current_bindings())
+
+
+def test_shape_cache():
+    func6.shape_cache_clear()
+    for _ in range(3):
+        assert func6(np.zeros((4, 6)), np.zeros((3, 2))) == {'W': 2, 'H': 3}
+    assert func6.shape_cache_info() == (2, 1, 2, 1)
+    with pytest.raises(ValidationError):
+        func6(np.zeros((4, 6)), np.zeros((3, 3)))
+    with pytest.raises(ValidationError):
+        func6(np.zeros((4, 6)), np.zeros((3, 3)))  # failures are never cached
+    assert func6.shape_cache_info().currsize == 1
+    func6(np.zeros((2, 2)), np.zeros((1, 1)))
+    func6(np.zeros((6, 2)), np.zeros((1, 3)))  # evicts (4, 6), (3, 2)
+    assert func6(mat1=np.zeros((4, 6)), mat2=np.zeros((3, 2))) == {'W': 2, 'H': 3}
+    assert func6.shape_cache_info() == (2, 6, 2, 2)
+
+
+@hirasawa_validate
+def func7(
+    data: Annt[NDArray[np.float64], tensorange[0:1]],
+    finite: Annt[NDArray[np.float64], tensorange(allow_nan=False, allow_inf=False, block_bytes=64)[:]] = np.zeros(1),
+):
+    pass
+
+
+@mark.parametrize('data', [
+    np.linspace(0, 0.99, 1000),
+    np.linspace(0, 0.99, 1000).reshape(10, 100)[:, ::3],  # non-contiguous
+    np.array([0.5, np.nan, 0.2]),  # NaN is allowed by default
+])
+def test_func7(data):
+    func7(data, finite=np.asarray(data)[np.isfinite(data)])
+
+
+@mark.parametrize('data, finite', [
+    (np.array([0.5, np.nan, 1.5]), np.zeros(1)),  # NaN must not hide the out-of-range 1.5
+    (np.array([-0.5, 0.5]), np.zeros(1)),
+    (np.zeros(1), np.r_[np.zeros(100), np.nan]),  # NaN in the last block
+    (np.zeros(1), np.r_[np.zeros(100), -np.inf, np.zeros(100)]),
+    (np.zeros(1), np.linspace(1, 2, 1000).reshape(10, 100)[:, ::3] * np.inf),
+])
+@should_raise(ValidationError)
+def test_func7_raise(data, finite):
+    func7(data, finite=finite)
+
+
+def _memmap(path, data: NDArray) -> np.memmap:
+    mm = np.memmap(path, dtype=data.dtype, mode='w+', shape=data.shape)
+    mm[:] = data
+    mm.flush()
+    return np.memmap(path, dtype=data.dtype, mode='r', shape=data.shape)
+
+
+@hirasawa_validate
+def func8(
+    data: Annt[NDArray[np.float32], tensorange(max_memory=4096, workers=4, block_bytes=512)[0:1]],
+):
+    pass
+
+
+def test_func8_memmap(tmp_path):
+    data = np.random.default_rng(0).random((64, 100), dtype=np.float32)
+    func8(_memmap(tmp_path / 'ok.dat', data))
+    data[-1, -1] = 1.0
+    with pytest.raises(ValidationError):
+        func8(_memmap(tmp_path / 'bad.dat', data))
+
+
+def test_func8_stop_early(tmp_path, monkeypatch):
+    import validators.reductions as reductions
+    reduced = []
+    original = reductions.minmax
+    def counting_minmax(value, *args):
+        reduced.append(value.size)
+        return original(value, *args)
+    monkeypatch.setattr(reductions, 'minmax', counting_minmax)
+    data = np.zeros((64, 100), dtype=np.float32)
+    data[0, 0] = -1.0
+    with pytest.raises(ValidationError):
+        func8(_memmap(tmp_path / 'bad.dat', data))
+    assert max(reduced) == 256  # 4096 bytes // 4 workers, float32
+    assert len(reduced) < data.size // 256
+
+
+def test_minmax_strided_rows():
+    from validators import reductions
+    column = np.random.default_rng(0).random((100_000, 4))[:, ::2]
+    column[50_000, 1] = np.nan
+    blocks = list(reductions.flat_blocks(column, 1 << 16))
+    assert len(blocks) == 100_000 * 16 // (1 << 16) + 1  # blocks of rows, not one per row
+    assert sum(block.size for block in blocks) == column.size
+    result = reductions.minmax(column, 1 << 16)
+    assert (result.min, result.max, result.has_nan) == (np.nanmin(column), np.nanmax(column), True)
+    assert reductions.chunked_minmax(column, 1 << 16, workers=2) == result
+
+
+def func9(
+    mat: Annt[NDArray[np.float64], tensorshape[W, H], tensorange[0:1]],
+    vec: Annt[NDArray[np.float64], tensorshape[H]],
+    /,
+    scale: float = 1.0,
+    *,
+    errors: int = 0,  # named like a local of the generated wrapper
+):
+    return mat.shape, vec.shape, scale, errors
+
+
+@mark.parametrize('args, kwargs', [
+    ((np.zeros((3, 2)), np.zeros(2)), {}),
+    ((np.zeros((3, 2)), np.zeros(2), 2), {'errors': '3'}),  # coerced by pydantic
+    ((np.zeros((3, 2)), np.zeros(3)), {'scale': 'x'}),
+    ((np.ones((3, 2)) * 2, [0.0, 0.0]), {}),
+    ((np.zeros((3, 2)),), {}),  # missing argument
+    ((np.zeros((3, 2)), np.zeros(2)), {'vec': np.zeros(2)}),  # positional only passed by keyword
+    ((np.zeros((3, 2)), np.zeros(2), 1.0, 2.0), {}),
+])
+def test_fast_path_matches_pydantic(args, kwargs):
+    results = []
+    for decorated in (hirasawa_validate(func9), hirasawa_validate(func9, fast=True)):
+        try:
+            results.append(decorated(*args, **kwargs))
+        except ValidationError as e:
+            results.append((e.title, str(e)))
+    assert results[0] == results[1]
+
+
+def test_validate_many():
+    from pydantic_core import ArgsKwargs
+    shapes = [
+        [(1, 4, 6), (1, 6, 5)],
+        [(2, 4, 6), (4, 7, 5)],
+        [(3, 4, 6), (4, 6, 9)],
+        [(3, 4, 8), (4, 6, 8)],
+        [(3, 4), (4, 6, 8)],
+    ]
+    arg_sets = [tuple(np.zeros(shape) for shape in pair) for pair in shapes]
+    arg_sets.append({'data1': np.zeros((3, 4, 8)), 'data2': np.zeros((4, 6, 5))})
+    arg_sets.append(ArgsKwargs((np.zeros((3, 4, 8)),), {'data2': np.zeros((4, 5, 5))}))
+    result = func3.validate_many(arg_sets)
+    assert result.valid.tolist() == [False, False, False, True, False, True, False]
+    assert sorted(result.errors) == [0, 1, 2, 4, 6]
+    for i, args in enumerate(arg_sets[:3]):
+        # same messages as validating the calls one by one
+        with pytest.raises(ValidationError) as exception_info:
+            func3(*args)
+        assert result.errors[i].split(': ', 1)[1] in str(exception_info.value)
+
+
+def test_validate_many_non_linear():
+    result = func4.validate_many([
+        (np.zeros((6, 4)), np.zeros((2, 6))),
+        (np.zeros((5, 4)), np.zeros((2, 5))),
+        (np.zeros((6, 4)), np.zeros((2, 5))),
+    ])
+    assert result.valid.tolist() == [True, False, False]
+
+
+def func10(
+    mat: Annt[NDArray[np.float64], tensorshape[W, W], tensorange[0:1]],
+):
+    return mat.shape
+
+
+def test_sample():
+    never = hirasawa_validate(func10, sample=0.0)
+    assert never(np.ones((2, 3)) * 5) == (2, 3)
+    always = hirasawa_validate(func10, sample=1.0)
+    with pytest.raises(ValidationError):
+        always(np.ones((2, 3)) * 5)
+
+
+def test_first_n():
+    decorated = hirasawa_validate(func10, first_n=2)
+    for _ in range(2):
+        with pytest.raises(ValidationError):
+            decorated(np.ones((2, 2)) * 5)
+    assert decorated(np.ones((2, 2)) * 5) == (2, 2)  # this signature is not validated anymore
+    with pytest.raises(ValidationError):
+        decorated(np.ones((3, 3)) * 5)  # a new signature is
+
+
+def test_first_n_bounded(monkeypatch):
+    from validators import decorator
+    monkeypatch.setattr(decorator, 'FIRST_N_SHAPES', 2)
+    decorated = hirasawa_validate(func10, first_n=1)
+    validated = []
+    for n in [2, 3, 2, 4, 3]:  # 3 is forgotten for 4, the least recently seen
+        try:
+            decorated(np.ones((n, n)) * 5)
+        except ValidationError:
+            validated.append(n)
+    assert validated == [2, 3, 4, 3]
+
+
+def test_first_n_threads():
+    decorated = hirasawa_validate(func10, first_n=5)
+    def call(_):
+        try:
+            decorated(np.ones((2, 2)) * 5)
+        except ValidationError:
+            return True
+        return False
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        assert sum(pool.map(call, range(800))) == 5
+
+
+def test_range_sample():
+    decorated = hirasawa_validate(func10, range_sample=0.0)
+    assert decorated(np.ones((2, 2)) * 5) == (2, 2)
+    with pytest.raises(ValidationError):
+        decorated(np.ones((2, 3)))  # shapes are still checked
+
+
+def test_disabled_by_env(monkeypatch):
+    monkeypatch.setenv('HIRASAWA_VALIDATE', 'off')
+    assert hirasawa_validate(func10) is func10
+    assert hirasawa_validate(fast=True)(func10) is func10
+
+
+def _imported_modules(code: str) -> dict[str, int]:
+    # module -> cumulative import time in us, as reported by `python -X importtime`
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, check=True, cwd=Path(__file__).parent,
+    )
+    modules = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def test_import_time():
+    modules = _imported_modules('import validators')
+    assert 'sympy' not in modules
+    assert 'numpy' not in modules
+    print(f'\nimport validators: {modules["validators"] / 1000:.1f} ms')
+
+
+def test_import_integer_tensorshape_without_sympy():
+    modules = _imported_modules(
+        'from validators import tensorshape, nrange, hirasawa_validate; '
+        'tensorshape[9, 9]; tensorshape[3:, "*"]; nrange[0:1]'
+    )
+    assert 'sympy' not in modules
+    assert 'numpy' not in modules
+
+
+@mark.parametrize('fast', [False, True])
+def test_instrumentation(fast):
+    from validators import instrumentation
+    decorated = hirasawa_validate(func10, fast=fast)
+    measurements = []
+    instrumentation.reset()
+    instrumentation.enable(sink=measurements.append)
+    try:
+        decorated(np.zeros((2, 2)))
+        with pytest.raises(ValidationError):
+            decorated(np.zeros((2, 3)))
+    finally:
+        instrumentation.disable()
+    decorated(np.zeros((2, 2)))  # not recorded
+    snapshot = instrumentation.snapshot()
+    function = snapshot[f'{__name__}.func10']
+    assert (function['calls'], function['failures']) == (2, 1)
+    assert 0 < function['validation_us'] <= function['total_us']
+    assert snapshot['tensorshape[W, W]']['calls'] == 2
+    assert snapshot['tensorshape[W, W]']['failures'] == 1
+    assert snapshot['tensorange[0:1]']['calls'] == 1
+    assert len(measurements) == 5
+    assert f'hirasawa_calls{{name="{__name__}.func10",kind="function"}} 2' in instrumentation.export_text()
+
+
+@hirasawa_validate
+def func11(
+    data1: Annt[NDArray, tensorshape[X + Y, X]],
+    data2: Annt[NDArray, tensorshape[Y, X - Y]],
+):
+    return dict(current_bindings())
+
+
+@mark.parametrize('fast', [False, True])
+def test_deferred_symbols(fast):
+    func = hirasawa_validate(fast=fast)(func11.__wrapped__)
+    assert func(np.zeros((7, 4)), np.zeros((3, 1))) == {'X': 4, 'Y': 3}
+    assert func(data2=np.zeros((3, 1)), data1=np.zeros((7, 4))) == {'X': 4, 'Y': 3}
+
+
+@mark.parametrize('shape1, shape2', [
+    [(7, 4), (2, 2)],  # Y should be 3
+    [(7, 4), (3, 2)],  # X - Y should be 1
+    [(3, 4), (0, 4)],  # Y = -1
+])
+@should_raise(ValidationError)
+def test_deferred_symbols_raise(shape1, shape2):
+    func11(np.zeros(shape1), np.zeros(shape2))
+
+
+@should_raise(ValidationError)
+def test_deferred_symbols_undetermined():
+    @hirasawa_validate
+    def func(data: Annt[NDArray, tensorshape[X + Y, 3]]):
+        pass
+    func(np.zeros((5, 3)))
+
+
+@should_raise(ValidationError)
+def test_deferred_symbols_non_integer():
+    @hirasawa_validate
+    def func(data: Annt[NDArray, tensorshape[X + Y, X - Y]]):
+        pass
+    func(np.zeros((10, 3)))  # X = 6.5
+
+
+def test_deferred_symbols_validate_many():
+    arg_sets = [
+        (np.zeros((7, 4)), np.zeros((3, 1))),
+        (np.zeros((7, 4)), np.zeros((2, 2))),
+        (np.zeros((3, 4)), np.zeros((0, 4))),
+    ]
+    result = func11.validate_many(arg_sets)
+    assert result.valid.tolist() == [True, False, False]
+    for i, args in enumerate(arg_sets[1:], 1):
+        with pytest.raises(ValidationError) as exception_info:
+            func11(*args)
+        assert result.errors[i].split(': ', 1)[1] in str(exception_info.value)
+
+
+def test_sympy_storage_exact():
+    from validators import SympyStorage
+    storage = SympyStorage()
+    storage[X + Y] = 2 ** 60 + 7
+    assert storage[X] is None
+    storage[X - Y] = 2 ** 60 - 7
+    assert storage[X] == 2 ** 60 and storage[Y] == 7  # no float rounding
+    storage.finish()
+    storage.clear()
+    storage[X + Y] = 3
+    with pytest.raises(ValueError):
+        storage.finish()
+
+
+def func12(
+    data1: Annt[NDArray, tensorange[0:1], tensorshape[X:Y]],
+    data2: Annt[NDArray, tensorshape[X, Y]],
+    scale: Annt[float, nrange[0:10]] = 1.0,
+):
+    return dict(current_bindings())
+
+
+@mark.parametrize('fast', [False, True])
+def test_plan_dependency_order(fast):
+    # `X:Y` of data1 is checked once data2 bound X and Y
+    func = hirasawa_validate(fast=fast)(func12)
+    assert func(np.zeros(3), np.zeros((2, 4))) == {'X': 2, 'Y': 4}
+    with pytest.raises(ValidationError) as exception_info:
+        func(np.zeros(5), np.zeros((2, 4)))
+    assert exception_info.value.errors()[0]['loc'] == (0,)
+    with pytest.raises(ValidationError) as exception_info:
+        func(data2=np.zeros((2, 4)), data1=np.zeros(5))
+    assert exception_info.value.errors()[0]['loc'] == ('data1',)
+
+
+@mark.parametrize('fast', [False, True])
+@mark.parametrize('kwargs', [
+    {'data2': np.zeros(2)},  # ndim
+    {'data2': np.zeros((4, 2))},  # X:Y
+    {'scale': 20.0},
+])
+def test_plan_data_checks_last(fast, kwargs, monkeypatch):
+    from validators import reductions
+    reduced = []
+    monkeypatch.setattr(reductions, 'minmax', lambda value, *args: reduced.append(value) or reductions.MinMax(0, 0, False, False))
+    func = hirasawa_validate(fast=fast)(func12)
+    func(np.zeros(3), np.zeros((2, 4)))
+    assert len(reduced) == 1
+    with pytest.raises(ValidationError):
+        func(**({'data1': np.full(3, 2.0), 'data2': np.zeros((2, 4))} | kwargs))
+    assert len(reduced) == 1  # the cheap failure stops the call before the data is read
+    with pytest.raises(ValidationError) as exception_info:
+        monkeypatch.setattr(reductions, 'minmax', lambda value, *args: reductions.MinMax(2, 2, False, False))
+        func(np.zeros(3), data2=np.zeros((2, 4)))
+    assert exception_info.value.errors()[0]['loc'] == (0,)
+
+
+def func13(
+    data: Annt[NDArray[np.float32], tensorshape[W, H]],
+    out: NDArray[np.float32] | None = None,
+) -> Annt[NDArray[np.float32], tensorshape[2*W, H]]:
+    out[:len(data)] = data
+    out[len(data):] = data
+    return out
+
+
+@mark.parametrize('fast', [False, True])
+def test_out_allocation(fast):
+    func = hirasawa_validate(fast=fast)(func13)
+    data = np.ones((3, 4), np.float32)
+    result = func(data)
+    assert result.shape == (6, 4) and result.dtype == np.float32
+    assert func(data) is not result
+    out = np.zeros((6, 4), np.float32)
+    assert func(data, out=out) is out
+    assert func(data, None) is not out
+    with pytest.raises(ValidationError) as exception_info:
+        func(data, out=np.zeros((5, 4), np.float32))
+    assert exception_info.value.errors()[0]['loc'] == ('out',)
+
+
+def test_out_pool():
+    func = hirasawa_validate(func13, out_pool=1, shape_cache=4)
+    data = np.ones((3, 4), np.float32)
+    result = func(data)
+    assert func(data) is result  # reused
+    assert func(np.ones((2, 4), np.float32)).shape == (4, 4)
+    assert func(data) is not result  # evicted by the (4, 4) buffer
+    with ThreadPoolExecutor(1) as pool:
+        assert pool.submit(func, data).result() is not func(data)  # one pool per thread
+
+
+def test_out_skip_modes(monkeypatch):
+    for options in [{'sample': 0.5}, {'first_n': 1}]:
+        with pytest.raises(TypeError, match='out'):
+            hirasawa_validate(func13, **options)
+    monkeypatch.setenv('HIRASAWA_VALIDATE', 'off')
+    with pytest.raises(TypeError, match='HIRASAWA_VALIDATE'):
+        hirasawa_validate(func13)
+
+
+@should_raise(ValidationError)
+def test_return_shape():
+    @hirasawa_validate
+    def func(data: Annt[NDArray, tensorshape[W]]) -> Annt[NDArray, tensorshape[W + 1]]:
+        return data
+    func(np.zeros(3))
+
+
+def func14(
+    weight: Annt[NDArray, tensorshape[F, 2]],
+    batches: Annt[Iterator[NDArray[np.float64]], tensorshape['*', F]],
+    limit: int,
+):
+    total = 0
+    for i, batch in enumerate(batches):
+        if i == limit:
+            break
+        total += len(batch)
+    return total, dict(current_bindings())
+
+
+@mark.parametrize('fast', [False, True])
+def test_stream(fast):
+    from itertools import count
+    func = hirasawa_validate(fast=fast)(func14)
+    endless = (np.zeros((i % 4 + 1, 3)) for i in count())  # pulled lazily, never materialized
+    assert func(np.zeros((3, 2)), endless, 1000) == (2500, {'F': 3})
+    batches = (np.zeros((2, 3 if i < 5 else 4)) for i in range(10))
+    with pytest.raises(ValidationError) as exception_info:
+        func(np.zeros((3, 2)), batches, 10)
+    assert exception_info.value.errors()[0]['loc'] == (5,)
+
+
+@should_raise(ValidationError)
+def test_stream_bound_by_first_item():
+    @hirasawa_validate
+    def func(batches: Annt[Iterable[NDArray[np.float64]], tensorshape[B, F]]):
+        return list(batches)
+    func([np.zeros((2, 3)), np.zeros((2, 3)), np.zeros((3, 3))])  # B = 2 stays bound
+
+
+@mark.parametrize('validator', [tensorange[0:1], tensorspec(range=slice(0, 1))[B, F]])
+def test_stream_data_validators(validator):
+    def func(batches: Annt[Iterator[NDArray[np.float64]], tensorshape[B, F], validator]):
+        return list(batches)
+    with pytest.raises(TypeError, match='stream'):
+        hirasawa_validate(func)
+
+
+async def func15(
+    data: Annt[NDArray, tensorange[0:1], tensorshape[W, H]],
+    weight: Annt[NDArray, tensorshape[H]],
+):
+    await asyncio.sleep(0)
+    return dict(current_bindings())
+
+
+@mark.parametrize('fast', [False, True])
+def test_async(fast):
+    func = hirasawa_validate(fast=fast, shape_cache=4)(func15)
+    assert inspect.iscoroutinefunction(func)
+
+    async def main():
+        results = await asyncio.gather(*(func(np.zeros((i, 2)), np.zeros(2)) for i in range(1, 4)))
+        assert results == [{'W': i, 'H': 2} for i in range(1, 4)]
+        with pytest.raises(ValidationError) as exception_info:
+            await func(np.zeros((2, 2)), np.zeros(3))
+        assert exception_info.value.errors()[0]['loc'] == (1,)
+        with pytest.raises(ValidationError) as exception_info:
+            await func(np.full((2, 2), 2.0), np.zeros(2))
+        assert exception_info.value.errors()[0]['loc'] == (0,)
+    asyncio.run(main())
+
+
+def test_async_range_off_event_loop(monkeypatch):
+    from validators import reductions
+    original = reductions.minmax
+    def slow_minmax(value, *args):
+        time.sleep(0.2)  # a reduction over a large payload, holding its thread
+        return original(value, *args)
+    monkeypatch.setattr(reductions, 'minmax', slow_minmax)
+    func = hirasawa_validate(func15, executor=ThreadPoolExecutor(1))
+
+    async def main():
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        task = asyncio.create_task(ticker())
+        await asyncio.sleep(0)
+        assert await func(np.random.rand(1000, 1000), np.zeros(1000)) == {'W': 1000, 'H': 1000}
+        task.cancel()
+        return ticks
+    assert asyncio.run(main()) >= 5
+
+
+def _outcome(validator, value):
+    try:
+        validator.validate(value)
+    except ValueError as e:
+        return str(e)
+
+
+@mark.parametrize('validator, value', [
+    (tensorshape[W, 2*H + 1], np.zeros((2, 3))),
+    (tensorshape[X:Y, X * Y], np.zeros((2, 6))),
+    (tensorshape[X:Y, X * Y], np.zeros((2, 7))),
+    (tensorange(allow_nan=False)[0:1], np.full(3, np.nan)),
+    (nrange[0:10], 12),
+])
+def test_pickle_validator(validator, value):
+    data = pickle.dumps(validator)
+    assert b'sympy' not in data  # compiled forms only
+    copy = pickle.loads(data)
+    assert repr(copy) == repr(validator)
+    assert _outcome(copy, value) == _outcome(validator, value)
+
+
+@mark.parametrize('fast', [False, True])
+def test_pickle_function(fast):
+    func = hirasawa_validate(fast=fast)(func12)
+    assert pickle.loads(pickle.dumps(func)) is pickle.loads(pickle.dumps(func))  # rebuilt once per process
+    assert pickle.loads(pickle.dumps(func5)) is func5
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:  # rebuilt from scratch
+        assert pool.submit(func, np.zeros(3), np.zeros((2, 4))).result() == {'X': 2, 'Y': 4}
+        assert pool.submit(func5, np.zeros((4, 2)), np.zeros((1, 2))).result() == {'W': 2, 'H': 1}
+
+
+@hirasawa_validate
+def func16(
+    scores: Annt[list[float], nrange[0:1]],
+    weights: Annt[NDArray[np.float64], nrange(max_indices=2)[0:]],
+):
+    return len(scores)
+
+
+def test_nrange_container():
+    scores = np.random.rand(1000).tolist()
+    assert func16(scores, np.ones((3, 4))) == 1000
+    scores[10], scores[500], scores[999] = 1.0, -0.5, float('nan')
+    with pytest.raises(ValidationError) as exception_info:
+        func16(scores, np.ones((3, 4)))
+    error, = exception_info.value.errors()  # one error for the whole list
+    assert error['loc'] == (0,) and error['ctx']['indices'] == [10, 500, 999] and error['ctx']['count'] == 3
+    weights = -np.ones((3, 4))
+    with pytest.raises(ValidationError) as exception_info:
+        func16([0.5], weights)
+    error, = exception_info.value.errors()
+    assert error['ctx']['indices'] == [(0, 0), (0, 1)] and error['ctx']['count'] == 12  # capped
+
+
+def func17(
+    data: Annt[NDArray[np.float32], tensorspec(dtype=np.float32, order='C', align=64, range=slice(0, 1), convert=True)[B, F]],
+    weight: Annt[NDArray[np.float32], tensorspec(dtype=np.float32, order='F')[F, F]],
+):
+    return data, dict(current_bindings())
+
+
+@mark.parametrize('fast', [False, True])
+def test_tensorspec(fast, monkeypatch):
+    from validators import reductions
+    func = hirasawa_validate(fast=fast)(func17)
+    weight = np.asfortranarray(np.eye(3, dtype=np.float32))
+    strided = np.zeros((4, 6), np.float32)[:, ::2]
+    data, bindings = func(strided, weight)
+    assert data.flags.c_contiguous and data.ctypes.data % 64 == 0 and bindings == {'B': 4, 'F': 3}
+    assert func(data, weight)[0] is data  # converted only when needed
+    reduced = []
+    monkeypatch.setattr(reductions, 'minmax', lambda value, *args: reduced.append(value) or reductions.MinMax(0, 0, False, False))
+    for data, weight_, error in [
+        (np.zeros((4, 3)), weight, 'tensor-dtype-mismatch'),
+        (strided, np.eye(3, dtype=np.float32), 'tensor-layout-error'),
+        (strided, np.eye(4, dtype=np.float32, order='F'), 'tensor-shape-mismatch'),
+    ]:
+        with pytest.raises(ValidationError) as exception_info:
+            func(data, weight_)
+        assert exception_info.value.errors()[0]['type'] == error
+    assert not reduced  # the one data pass only runs once everything else passed
+    monkeypatch.undo()
+    with pytest.raises(ValidationError) as exception_info:
+        func(np.full((4, 3), 2, np.float32), weight)
+    assert exception_info.value.errors()[0]['type'] == 'tensor-range-error'
+
+
+def test_interned_validators():
+    assert tensorshape[W, 2*H] is tensorshape[W, 2*H]
+    assert tensorange(allow_nan=False)[0:1] is tensorange(allow_nan=False)[0:1]
+    assert nrange[0:1] is not nrange[0.0:1.0] and tensorange[0:1] is not tensorange(allow_nan=False)[0:1]
+    with pytest.raises(TypeError):
+        tensorshape[True]  # not the interned `tensorshape[1]`
+
+
+def test_shared_schemas():
+    from validators.schemacache import _schemas
+    spec = tensorshape['*', F]  # shared by a stream and a tensor annotation, which validate differently
+
+    def stream(batches: Annt[Iterator[NDArray[np.float64]], spec]):
+        return [len(batch) for batch in batches]
+
+    def tensor(batch: Annt[NDArray[np.float64], spec]):
+        return len(batch)
+
+    funcs = [hirasawa_validate(func) for func in (stream, tensor, stream, tensor)]
+    assert Annt[NDArray[np.float64], spec] in _schemas
+    for func in funcs[::2]:
+        assert func(iter([np.zeros((2, 3)), np.zeros((1, 3))])) == [2, 1]
+    for func in funcs[1::2]:
+        assert func(np.zeros((2, 3))) == 2
+        with pytest.raises(ValidationError):
+            func(iter([np.zeros((2, 3))]))
+
+
+class DLPackOnly:
+    def __init__(self, array):
+        self._array = array
+
+    def __dlpack__(self, **kwargs):
+        return self._array.__dlpack__(**kwargs)
+
+
+class ArrayInterfaceOnly:
+    def __init__(self, array):
+        self.__array_interface__ = array.__array_interface__
+
+
+@mark.parametrize('fast', [False, True])
+def test_shape_of_interfaces(fast):
+    from validators.protocols import _shape_readers, _tensor_types
+
+    def func(a: Annt[Any, tensorshape[H, W]], b: Annt[Any, tensorshape[W]]):
+        return H, W
+
+    func = hirasawa_validate(func, fast=fast)
+    for a, b in [
+        (DLPackOnly(np.zeros((2, 3))), ArrayInterfaceOnly(np.zeros(3))),
+        (memoryview(np.zeros((2, 3))), b'abc'),
+        (np.zeros((2, 3)), bytearray(3)),
+    ]:
+        func(a, b)
+        with pytest.raises(ValidationError):
+            func(a, b'ab')
+    assert _tensor_types[np.ndarray] and not _tensor_types[DLPackOnly]
+    assert _shape_readers[ArrayInterfaceOnly] is not None
+    with pytest.raises(TypeError):
+        func(3, b'abc')
+
+
+@mark.parametrize('fast', [False, True])
+def test_dlpack_export_errors(fast):
+    def func(a: Annt[Any, tensorshape[H, W]]):
+        return H, W
+
+    func = hirasawa_validate(func, fast=fast)
+    frozen = np.zeros((2, 3))
+    frozen.flags.writeable = False  # refused by the legacy export
+    func(DLPackOnly(frozen))
+    with pytest.raises(ValidationError):
+        func(DLPackOnly(frozen[0]))
+    with pytest.raises(ValidationError) as e:
+        func(DLPackOnly(np.zeros((2, 3), dtype=[('x', 'i4'), ('y', 'f8')])))
+    assert e.value.errors()[0]['type'] == 'tensor-shape-mismatch'
+
+
+def test_sig_inject():
+    from pydantic import validate_call
+    from sig_inject import _makers, sig_inject
+    spec = ['a', '/', ('b', int, 0), '*args', ('c', str, 'x'), '**kwargs']
+
+    def target(*args, **kwargs):
+        return args, kwargs
+
+    func = validate_call(sig_inject(spec, tuple)(target))
+    assert str(inspect.signature(func)) == "(a, /, b: int = 0, *args, c: str = 'x', **kwargs) -> tuple"
+    assert func(1, '2', 3, c='y', d=4) == ((1, 2, 3), {'c': 'y', 'd': 4})
+    with pytest.raises(ValidationError):
+        func(1, 'two')
+    count = len(_makers)
+    assert sig_inject(spec, tuple)(target).__code__ is sig_inject(spec, tuple)(print).__code__
+    assert len(_makers) == count
+    assert inspect.signature(sig_inject([('b', int, False)], None)(target)).parameters['b'].default is False
+
+    def inner(x, y):
+        return x + y
+
+    @functools.wraps(inner)
+    def forward(*args, **kwargs):
+        return inner(*args, **kwargs)
+
+    forward.tag = 'kept'
+    func = validate_call(sig_inject([('p', int), ('q', int)], int)(forward))
+    assert str(inspect.signature(func)) == '(p: int, q: int) -> int'
+    assert func('1', 2) == 3 and func.tag == 'kept'
+
+
+class Record(ShapedModel):
+    points: Annt[NDArray[np.float64], tensorshape[B, F]]
+    labels: Annt[NDArray[np.float64], tensorshape[B]]
+    total: Annt[NDArray[np.float64], tensorshape[X + Y]] | None = None
+    split: Annt[NDArray[np.float64], tensorshape[X, Y]] | None = None
+
+    @model_validator(mode='after')
+    def keep_bindings(self):
+        self.__dict__['bindings'] = dict(current_bindings())
+        return self
+
+
+class Records(ShapedModel):
+    first: Record
+    second: Record
+    weights: Annt[NDArray[np.float64], tensorshape[B]]
+
+
+def test_shaped_model():
+    record = Record(points=np.zeros((3, 2)), labels=np.zeros(3))
+    assert record.__dict__['bindings'] == {'B': 3, 'F': 2}
+    with pytest.raises(ValidationError) as exception_info:
+        Record(points=np.zeros((3, 2)), labels=np.zeros(4))
+    assert exception_info.value.errors()[0]['loc'] == ('labels',)
+    assert Record(points=np.zeros((3, 2)), labels=np.zeros(3), total=np.zeros(5), split=np.zeros((2, 3))).__dict__['bindings']['Y'] == 3
+    with pytest.raises(ValidationError):
+        Record(points=np.zeros((3, 2)), labels=np.zeros(3), total=np.zeros(6), split=np.zeros((2, 3)))
+    # nested models bind their own symbols
+    Records(first=record, second={'points': np.zeros((5, 2)), 'labels': np.zeros(5)}, weights=np.zeros(7))
+    records = TypeAdapter(list[Record]).validate_python(
+        [{'points': np.zeros((n, 2)), 'labels': np.zeros(n)} for n in range(1, 1000)]
+    )
+    assert records[-1].__dict__['bindings'] == {'B': 999, 'F': 2}
+    with pytest.raises(ValidationError) as exception_info:
+        TypeAdapter(list[Record]).validate_python([{'points': np.zeros((2, 2)), 'labels': np.zeros(2)}, {'points': np.zeros((2, 2)), 'labels': np.zeros(1)}])
+    assert exception_info.value.errors()[0]['loc'] == (1, 'labels')
+
+
+def test_tensorange_cache(monkeypatch):
+    import gc
+    from validators import rangecache, reductions
+    scanned = []
+    minmax = reductions.minmax
+    monkeypatch.setattr(reductions, 'minmax', lambda value, *args: scanned.append(value.shape) or minmax(value, *args))
+
+    @hirasawa_validate
+    def first(data: Annt[NDArray[np.float64], tensorange(cache=True)[0:1]]):
+        return second(data)
+
+    @hirasawa_validate
+    def second(data: Annt[NDArray[np.float64], tensorange(cache=True, allow_nan=False)[-1:1]]):
+        return data
+
+    frozen = np.frombuffer(np.random.rand(6).tobytes())
+    first(frozen)
+    first(frozen)
+    assert scanned == [(6,)]
+    first(frozen[::2])
+    assert scanned == [(6,), (3,)]
+    writeable = np.random.rand(6)
+    view = writeable[:]
+    view.flags.writeable = False  # still written through `writeable`
+    first(writeable)
+    first(view)
+    assert len(scanned) == 6  # by both functions
+    over_bytes = np.frombuffer(np.full(2, np.nan).tobytes())  # frozen, its buffer too
+    for _ in range(2):
+        with pytest.raises(ValidationError):
+            second(over_bytes)
+    assert len(scanned) == 7 and len(rangecache._entries) == 3
+    del frozen
+    gc.collect()
+    assert len(rangecache._entries) == 1
+    owned = np.random.rand(6)  # owns its memory, can be made writeable again
+    owned.flags.writeable = False
+    first(owned)
+    owned.flags.writeable = True
+    owned[0] = 5.0
+    owned.flags.writeable = False
+    with pytest.raises(ValidationError):
+        first(owned)
+    assert len(rangecache._entries) == 1
+
+
+def test_tensorange_cache_evict_in_store():
+    import gc
+    import threading
+    from validators import rangecache, reductions
+
+    def collect_while_storing():
+        frozen = np.frombuffer(np.random.rand(4).tobytes())
+        rangecache.store(rangecache.lookup(frozen), reductions.minmax(frozen))
+        with rangecache._lock:  # like a collection triggered by an allocation inside `store`
+            del frozen
+            gc.collect()
+
+    thread = threading.Thread(target=collect_while_storing, daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def func18(
+    rows: Annt[list[NDArray[np.float64]], tensorshape(split=0)[N, F], tensorange[0:1]],
+    columns: Annt[tuple[NDArray[np.float64], ...], tensorshape(split=-1)[F, 2*N]],
+):
+    return dict(current_bindings())
+
+
+@mark.parametrize('fast', [False, True])
+def test_shards(fast):
+    func = hirasawa_validate(func18, fast=fast)
+    rows = [np.zeros((2, 3)), np.zeros((0, 3)), np.full((4, 3), 0.5)]
+    assert func(rows, (np.zeros((3, 5)), np.zeros((3, 7)))) == {'N': 6, 'F': 3}
+    assert func(rows, np.zeros((3, 12))) == {'N': 6, 'F': 3}  # a single shard
+    assert func.validate_many([
+        (rows, (np.zeros((3, 12)),)),
+        (rows, (np.zeros((3, 11)),)),
+        ([np.zeros((2, 3)), np.zeros((2, 2))], (np.zeros((3, 8)),)),
+    ]).valid.tolist() == [True, False, False]
+    for args, loc, error in [
+        (([np.zeros((2, 3)), np.zeros((4, 2))], np.zeros((3, 12))), 0, 'tensor-shape-mismatch'),
+        (([], np.zeros((3, 0))), 0, 'tensor-shape-mismatch'),
+        ((rows, (np.zeros((3, 5)), np.zeros((3, 5)))), 1, 'tensor-shape-mismatch'),
+        (([np.zeros((2, 3)), np.full((1, 3), 2.0)], np.zeros((3, 6))), 0, 'tensor-range-error'),
+    ]:
+        with pytest.raises(ValidationError) as exception_info:
+            func(*args)
+        assert exception_info.value.errors()[0]['loc'] == (loc,)
+        assert exception_info.value.errors()[0]['type'] == error
+    with pytest.raises(ValueError):
+        tensorshape(split=2)[N, F]
+
+
+def func19(
+    a: Annt[NDArray[np.float64], tensorshape[W]],
+    b: Annt[NDArray[np.float64], tensorshape[W]] | None = None,
+):
+    return dict(current_bindings())
+
+
+def func20(
+    a: Annt[NDArray[np.float64], tensorshape[W]],
+    bs: list[Annt[NDArray[np.float64], tensorshape[W]]],
+):
+    return dict(current_bindings())
+
+
+def func21(
+    bs: list[Annt[NDArray[np.float64], tensorshape[X + Y]]],
+    a: Annt[NDArray[np.float64], tensorshape[X]],
+):
+    return dict(current_bindings())
+
+
+@mark.parametrize('fast', [False, True])
+@mark.parametrize('shape_cache', [None, 4])
+def test_nested_shapes(fast, shape_cache):
+    func = hirasawa_validate(func19, fast=fast, shape_cache=shape_cache)
+    assert func(np.zeros(3), np.zeros(3)) == func(np.zeros(3)) == {'W': 3}
+    with pytest.raises(ValidationError) as exception_info:
+        func(a=np.zeros(3), b=np.zeros(4))
+    assert exception_info.value.errors()[0]['loc'] == ('b',)
+    func = hirasawa_validate(func20, fast=fast, shape_cache=shape_cache)
+    assert func(np.zeros(3), [np.zeros(3), np.zeros(3)]) == {'W': 3}
+    with pytest.raises(ValidationError) as exception_info:
+        func(np.zeros(3), [np.zeros(3), np.zeros(4)])
+    assert exception_info.value.errors()[0]['loc'] == (1, 1)
+    func = hirasawa_validate(func21, fast=fast)
+    assert func([np.zeros(5), np.zeros(5)], np.zeros(2)) == {'X': 2, 'Y': 3}
+    with pytest.raises(ValidationError):
+        func([np.zeros(5), np.zeros(6)], np.zeros(2))
+
+
+def test_fast_nested_errors():
+    def func(
+        bs: list[Annt[NDArray[np.float64], tensorshape[W], tensorange[0:1]]],
+        xs: list[Annt[float, nrange[0:1]]],
+        n: int,
+    ):
+        return None
+
+    for args in [
+        ([np.zeros(4), np.zeros(5)], [0.5], 'x'),
+        ([np.zeros(4), np.full(4, 2.0)], [1.5], 1),
+    ]:
+        errors = []
+        for fast in (False, True):
+            with pytest.raises(ValidationError) as exception_info:
+                hirasawa_validate(func, fast=fast)(*args)
+            errors.append([(error['type'], error['loc'], error['msg']) for error in exception_info.value.errors()])
+        assert errors[0] == errors[1]
+
+
+@mark.parametrize('fast', [False, True])
+def test_deferred_var_positional(fast):
+    def func(
+        scale: float,
+        *arrs: Annt[NDArray[np.float64], tensorshape[X + Y]],
+        b: Annt[NDArray[np.float64], tensorshape[X, Y]],
+    ):
+        return dict(current_bindings())
+
+    func = hirasawa_validate(func, fast=fast)
+    assert func(1.0, np.zeros(5), np.zeros(5), b=np.zeros((2, 3))) == {'X': 2, 'Y': 3}
+    assert func(1.0, b=np.zeros((2, 3))) == {'X': 2, 'Y': 3}
+    with pytest.raises(ValidationError):
+        func(1.0, np.zeros(5), np.zeros(6), b=np.zeros((2, 3)))
@@ -1,26 +1,16 @@
 from .nrange import nrange
 from .tensorshape import tensorshape
 from .tensorange import tensorange
-from .sympystorage import SympyStorage
+from .tensorspec import tensorspec
+from .scope import current_bindings
+from .decorator import hirasawa_validate
+from .model import ShapedModel
+from . import instrumentation
 
-from functools import wraps
-from typing import Callable
-from pydantic import validate_call
-from sympy import Expr
 
-
-def hirasawa_validate(func: Callable):
-    func.__validate_equalities__: set[Expr] = set()  # type: ignore
-    func.__sympy_storage__ = SympyStorage()  # type: ignore
-    func = validate_call(config={'arbitrary_types_allowed': True})(func)
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        try:
-            res = func(*args, **kwargs)  # in order to let finally work.
-            func.__validate_equalities__.clear()  # type: ignore
-            func.__sympy_storage__.clear()  # type: ignore
-            return res
-        finally:
-            func.__validate_equalities__.clear()  # type: ignore
-            func.__sympy_storage__.clear()  # type: ignore
-    return wrapper
\ No newline at end of file
+def __getattr__(name: str):
+    # importing sympy takes most of a second, only do it when `SympyStorage` is asked for
+    if name == 'SympyStorage':
+        from .sympystorage import SympyStorage
+        return SympyStorage
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import Callable, Any
+from collections import abc
+from typing import Callable, Any, Hashable, get_origin
 
 from pydantic_core import core_schema
 
@@ -7,41 +8,94 @@ from pydantic_core import CoreSchema, core_schema
 from pydantic import GetCoreSchemaHandler
 from functools import lru_cache
 
+from . import instrumentation
+
+
+# annotations of streams of tensors, which are checked item by item as they are pulled
+_STREAMS = (abc.Iterator, abc.Iterable, abc.Generator)
+
 
 class BaseValidator(ABC):
-    source_type: type
-    validate_obj: Any
-    symbol_namespace: dict[str, Any]
+    # validators reading every element, like `tensorange`, run after all the cheap checks of a call
+    reads_data: bool = False
     
     @abstractmethod
     def validate(self, value: Any) -> Any:
         pass
-    
+
+    def skipped(self) -> bool:
+        '''
+        True when the current call does not run this check here, e.g. a validation plan runs it,
+        so instrumentation does not count it.
+        '''
+        return False
+
+    def validator_for(self, source_type: Any) -> Callable[[Any], Any]:
+        '''
+        The check of a value annotated with `source_type`, `validate` unless overridden.
+        Validators are shared by every annotation using them, so nothing about one is stored on them.
+        '''
+        return self.validate
+
     def __get_pydantic_core_schema__(
         self,
         source_type: type,
         handler: GetCoreSchemaHandler,
     ) -> CoreSchema:
-        locals_namespace = getattr(handler._get_types_namespace().locals, 'data', {})
-        global_namespace = handler._get_types_namespace().globals
-        decorated_func = locals_namespace.get('func')
-        self.source_type = source_type
-        self.validate_obj = decorated_func
+        if self.reads_data and get_origin(source_type) in _STREAMS:
+            raise TypeError(
+                f'{self!r} reads the data of a tensor-like object and can not check a stream of them, '
+                f'annotate a list or check the items in the function body'
+            )
+        validate = self.validator_for(source_type)
         def function(value: Any, handler: Callable):
-            return self.validate(value)
+            # inner validators of the same `Annotated` and the type check of `source_type` run first
+            if instrumentation.enabled:
+                return instrumentation.measure_validator(self, handler(value), validate)
+            return validate(handler(value))
         return core_schema.no_info_wrap_validator_function(
             function,
             handler(source_type),
         )
         
 
+def _intern_key(obj: Any) -> Hashable:
+    # typed, so that `1`, `1.0` and `True` never share a validator
+    if isinstance(obj, tuple):
+        return (tuple, *map(_intern_key, obj))
+    if isinstance(obj, slice):
+        return (slice, _intern_key(obj.start), _intern_key(obj.stop), _intern_key(obj.step))
+    return (type(obj), obj)
+
+
+def _range_text(start: Any, stop: Any) -> str:
+    return f'{"" if start is None else start}:{"" if stop is None else stop}'
+
+
 class SubscriptableValidator(BaseValidator):
     @classmethod
     @lru_cache(maxsize=1)
     def subscriptable(cls):
+        interned: dict[Hashable, SubscriptableValidator] = {}
+
         class Subscriptable:
+            def __init__(self, **options):
+                self._options = options
+
             def __getitem__(self, *args, **kwargs):
-                return cls(*args, **kwargs)
+                # equal specs share one validator, and its compiled constraints and cached schemas
+                try:
+                    key = _intern_key((args, *sorted(self._options.items()), *sorted(kwargs.items())))
+                    validator = interned.get(key)
+                except TypeError:  # some unhashable option
+                    return cls(*args, **self._options, **kwargs)
+                if validator is None:
+                    validator = interned.setdefault(key, cls(*args, **self._options, **kwargs))
+                return validator
+
+            def __call__(self, **options):
+                # `validator(option=...)[...]` passes keyword options to the validator
+                return Subscriptable(**(self._options | options))
         return Subscriptable()
     
 
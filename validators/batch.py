@@ -0,0 +1,208 @@
+from functools import singledispatch
+from typing import Any, Iterable, NamedTuple
+
+import numpy as np
+from pydantic_core import ArgsKwargs, PydanticCustomError
+
+from .shapecompiler import (
+    Bindings, Deferred, DimConstraint,
+    _AnyDim, _ConstDim, _ExprDim, _LinearForm, _RangeDim, _Form,
+)
+from .plan import ValidationPlan
+from .signature import _MISSING
+
+
+class ShapeBatchResult(NamedTuple):
+    valid: np.ndarray  # bool mask, one entry per argument set
+    errors: dict[int, str]  # first error of every invalid row
+
+
+class BatchBindings:
+    '''
+    Bindings of many calls at once, one int64 column and one "is bound" mask per symbol.
+    Rows with deferred equations (`X + Y` before `X` or `Y` is known) are checked row by row.
+    '''
+    def __init__(self, n: int) -> None:
+        self.n = n
+        self.values: dict[str, np.ndarray] = {}
+        self.bound: dict[str, np.ndarray] = {}
+        self.deferred: dict[int, Deferred] = {}
+        self.pending = np.zeros(n, dtype=bool)  # rows with a non-empty entry in `deferred`
+        self.messages: dict[int, str] = {}  # errors of the rows checked one by one
+
+    def column(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        if name not in self.values:
+            self.values[name] = np.zeros(self.n, dtype=np.int64)
+            self.bound[name] = np.zeros(self.n, dtype=bool)
+        return self.values[name], self.bound[name]
+
+    def row(self, i: int) -> Bindings:
+        return {name: int(self.values[name][i]) for name in self.values if self.bound[name][i]}
+
+    def bind(self, name: str, values: np.ndarray, rows: np.ndarray) -> None:
+        column, bound = self.column(name)
+        column[rows] = values[rows]
+        bound |= rows
+
+
+@singledispatch
+def check_many(constraint: DimConstraint, batch: BatchBindings, sizes: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    '''
+    Vectorized `DimConstraint.check` over the `rows` of a batch, returns the mask of failed rows.
+    Only rows that pass bind new symbols.
+    Constraints without a vectorized form are checked row by row.
+    '''
+    failed = np.zeros(batch.n, dtype=bool)
+    for i in np.flatnonzero(rows).tolist():  # python ints, to key the dicts of the batch
+        bindings = batch.row(i)
+        deferred = batch.deferred.get(i) or Deferred()
+        try:
+            constraint.check(bindings, int(sizes[i]), deferred)
+        except ValueError as e:
+            failed[i] = True
+            batch.messages[i] = str(e)
+            continue
+        if deferred:
+            batch.deferred[i] = deferred
+        batch.pending[i] = bool(deferred)
+        for name, value in bindings.items():
+            column, bound = batch.column(name)
+            column[i] = value
+            bound[i] = True
+    return failed
+
+
+@check_many.register
+def _(constraint: _AnyDim, batch: BatchBindings, sizes: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    return np.zeros(batch.n, dtype=bool)
+
+
+@check_many.register
+def _(constraint: _ConstDim, batch: BatchBindings, sizes: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    return rows & (sizes != constraint.size)
+
+
+def _linear_value(form: _LinearForm, batch: BatchBindings) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    `den * form` of every row and the mask of rows where all its symbols are bound.
+    '''
+    total = np.full(batch.n, form.const, dtype=np.int64)
+    complete = np.ones(batch.n, dtype=bool)
+    for name, coeff in form.terms:
+        column, bound = batch.column(name)
+        total += coeff * np.where(bound, column, 0)
+        complete &= bound
+    return total, complete
+
+
+@check_many.register
+def _(constraint: _ExprDim, batch: BatchBindings, sizes: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    form = constraint.form
+    if not isinstance(form, _LinearForm):
+        return check_many.dispatch(DimConstraint)(constraint, batch, sizes, rows)
+    residual = sizes * form.den - form.const
+    n_unbound = np.zeros(batch.n, dtype=np.int64)
+    unbound_coeff = np.zeros(batch.n, dtype=np.int64)
+    for name, coeff in form.terms:
+        column, bound = batch.column(name)
+        residual -= coeff * np.where(bound, column, 0)
+        n_unbound += ~bound
+        unbound_coeff += np.where(bound, 0, coeff)
+    failed = rows & (n_unbound == 0) & (residual != 0)
+    solve = rows & (n_unbound == 1)
+    solution, remainder = np.divmod(residual, np.where(solve, unbound_coeff, 1))
+    failed |= solve & ((remainder != 0) | (solution < 0))
+    solve &= ~failed
+    for name, _ in form.terms:
+        batch.bind(name, solution, solve & ~batch.column(name)[1])
+    return failed | check_many.dispatch(DimConstraint)(constraint, batch, sizes, rows & (n_unbound > 1))
+
+
+@check_many.register
+def _(constraint: _RangeDim, batch: BatchBindings, sizes: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    if any(isinstance(bound, _Form) and not isinstance(bound, _LinearForm) for bound in (constraint.start, constraint.stop)):
+        return check_many.dispatch(DimConstraint)(constraint, batch, sizes, rows)
+    failed = np.zeros(batch.n, dtype=bool)
+    for bound, is_start in ((constraint.start, True), (constraint.stop, False)):
+        if bound is None:
+            continue
+        if isinstance(bound, int):
+            total, den, complete = np.full(batch.n, bound, dtype=np.int64), 1, np.ones(batch.n, dtype=bool)
+        else:
+            assert isinstance(bound, _LinearForm)
+            (total, complete), den = _linear_value(bound, batch), bound.den
+        ok = sizes * den >= total if is_start else sizes * den < total
+        failed |= rows & (~complete | ~ok)
+    return failed
+
+
+def _split(arg_set: Any) -> tuple[tuple, dict]:
+    if isinstance(arg_set, ArgsKwargs):
+        return arg_set.args, arg_set.kwargs or {}
+    if isinstance(arg_set, dict):
+        return (), arg_set
+    return tuple(arg_set), {}
+
+
+def validate_shapes_many(plan: ValidationPlan, arg_sets: Iterable[Any]) -> ShapeBatchResult:
+    '''
+    Check the `tensorshape` annotations of many argument sets at once, in the order of the validation plan.
+    Each argument set is a tuple of positional arguments, a dict of keyword arguments
+    or a `pydantic_core.ArgsKwargs` for both.
+    '''
+    calls = [_split(arg_set) for arg_set in arg_sets]
+    n = len(calls)
+    batch = BatchBindings(n)
+    active = np.ones(n, dtype=bool)
+    errors: dict[int, str] = {}
+
+    def fail(i: int, message: str) -> None:
+        active[i] = False
+        errors[i] = message
+
+    present: list[np.ndarray] = []
+    sizes: dict[tuple[int, int], np.ndarray] = {}
+    for index, (slot, validators) in enumerate(plan.shape_slots):
+        values = [slot.fetch(args, kwargs) for args, kwargs in calls]
+        present.append(np.array([value is not _MISSING for value in values], dtype=bool))  # defaults are not validated
+        for validator in validators:
+            ndim = len(validator._size)
+            shapes = sizes[index, id(validator)] = np.zeros((n, ndim), dtype=np.int64)
+            for i, value in enumerate(values):
+                if not active[i] or value is _MISSING:
+                    continue
+                try:
+                    shape = validator.shape_of(value)
+                except PydanticCustomError as e:
+                    fail(i, f'{slot.name}: {e.message()}')
+                    continue
+                if shape is None or len(shape) != ndim:
+                    fail(i, f'{slot.name}: This tensor-like object must have {ndim} dimensions, which shape is {shape}')
+                    continue
+                shapes[i] = shape
+    for index, validator, dim, constraint in plan.ordered:
+        name = plan.shape_slots[index][0].name
+        rows = active & present[index]
+        if constraint is None:
+            for i in np.flatnonzero(rows & batch.pending).tolist():
+                try:
+                    batch.deferred[i].finish(batch.row(i))
+                except ValueError as e:
+                    fail(i, f'{name}: This call {e}')
+            continue
+        column = sizes[index, id(validator)][:, dim]
+        pending = rows & batch.pending
+        failed = check_many(constraint, batch, column, rows & ~pending)
+        if pending.any():  # only the scalar path resolves deferred equations
+            failed |= check_many.dispatch(DimConstraint)(constraint, batch, column, pending)
+        for i in np.flatnonzero(failed).tolist():
+            message = batch.messages.pop(i, None)
+            if message is None:
+                # failed rows bind nothing, replay them on the scalar path for the error message
+                try:
+                    constraint.check(batch.row(i), int(column[i]))
+                    message = 'invalid size'
+                except ValueError as e:
+                    message = str(e)
+            fail(i, f'{name}: The {dim}-th dimension of this tensor-like object {message}')
+    return ShapeBatchResult(active, errors)
@@ -0,0 +1,298 @@
+import os
+import sys
+from concurrent.futures import Executor
+from functools import partial, update_wrapper, wraps
+from inspect import Parameter, iscoroutinefunction
+from types import MethodType
+from random import random
+from time import perf_counter_ns
+from typing import Any, Callable, Hashable
+
+from pydantic import ValidationError, validate_call
+from pydantic_core import PydanticCustomError
+
+from . import instrumentation
+
+from .fastpath import build_fast_call
+from .scope import ValidationScope, _scope_var
+from .output import OutputSpec
+from .shapecache import ShapeCache, ShapeCounter
+from .shapecompiler import Bindings
+from .plan import ValidationPlan
+from .protocols import shape_of
+from .schemacache import with_cached_schemas
+from .signature import _MISSING, ParamSlot, _annotations, param_slots
+from .tensorshape import _TensorShapeValidator
+
+
+# `HIRASAWA_VALIDATE=off` makes `hirasawa_validate` return the undecorated function.
+ENV_VAR = 'HIRASAWA_VALIDATE'
+
+# `first_n` counts the calls of this many shape signatures, the least recently seen ones are forgotten
+FIRST_N_SHAPES = 4096
+
+
+def _disabled() -> bool:
+    return os.environ.get(ENV_VAR, '').strip().lower() in ('0', 'off', 'false', 'no')
+
+
+def _shape_key(slots: list[ParamSlot], args: tuple, kwargs: dict) -> Hashable | None:
+    key: list[tuple[type, tuple[int, ...]] | None] = []
+    for slot in slots:
+        value = slot.fetch(args, kwargs)
+        if value is _MISSING or value is None:  # not validated, or an `out` to allocate
+            key.append(None)
+            continue
+        try:
+            shape = shape_of(value)
+        except PydanticCustomError:
+            return None  # let the validators report it
+        if shape is None:
+            return None  # not tensor-like, let the validators report it
+        key.append((type(value), shape))
+    return tuple(key)
+
+
+def _measured_call(original: Callable, scope: ValidationScope, func: Callable, args: tuple, kwargs: dict) -> Any:
+    stats = instrumentation.stats_of(original, f'{original.__module__}.{original.__qualname__}', 'function')
+    start = perf_counter_ns()
+    failed = False
+    try:
+        return func(*args, **kwargs)
+    except ValidationError as e:
+        failed = e.title == original.__name__  # not raised by a validated function called in the body
+        raise
+    finally:
+        stats.record(perf_counter_ns() - start, failed, scope.validation_ns)
+
+
+async def _measured_call_async(original: Callable, scope: ValidationScope, func: Callable, args: tuple, kwargs: dict) -> Any:
+    stats = instrumentation.stats_of(original, f'{original.__module__}.{original.__qualname__}', 'function')
+    start = perf_counter_ns()
+    failed = False
+    try:
+        return await func(*args, **kwargs)
+    except ValidationError as e:
+        failed = e.title == original.__name__
+        raise
+    finally:
+        stats.record(perf_counter_ns() - start, failed, scope.validation_ns)
+
+
+class ValidatedFunction(partial):
+    '''
+    What `hirasawa_validate` returns: the validating wrapper of `original`, looking like `original`.
+    It pickles as a reference, to the module attribute it is bound to, or else to `original`
+    and the decorator options, so `ProcessPoolExecutor` workers rebuild it once per process.
+    A partial keeps the native call path, a plain function can not define how it pickles.
+    '''
+    # set by `update_wrapper` and `__new__`
+    __wrapped__: Callable
+    __qualname__: str
+    _options: dict[str, Any]
+
+    def __new__(cls, wrapper: Callable, original: Callable, options: dict[str, Any]) -> 'ValidatedFunction':
+        self = super().__new__(cls, wrapper)
+        update_wrapper(self, wrapper)
+        self.__wrapped__ = original
+        self._options = options
+        return self
+
+    def __get__(self, instance: Any, owner: type | None = None) -> Any:
+        # bound like the function it replaces when it decorates a method
+        return self if instance is None else MethodType(self, instance)
+
+    def __repr__(self) -> str:
+        return f'<validated function {self.__qualname__}>'
+
+    def __reduce__(self) -> Any:
+        module = sys.modules.get(self.__module__)
+        target: Any = module
+        for name in self.__qualname__.split('.'):
+            target = getattr(target, name, None)
+        if target is self:  # decorated with `@hirasawa_validate`, the import in the worker rebuilds it
+            return self.__qualname__
+        # the executor does not cross processes, the worker uses the default one
+        return _rebuild, (self.__wrapped__, {**self._options, 'executor': None})
+
+
+_rebuilt: dict[tuple, ValidatedFunction] = {}
+
+
+def _rebuild(original: Callable, options: dict[str, Any]) -> ValidatedFunction:
+    key = (original, *sorted(options.items()))
+    func = _rebuilt.get(key)
+    if func is None:
+        func = _rebuilt[key] = hirasawa_validate(original, **options)
+    return func
+
+
+def hirasawa_validate(
+    func: Callable | None = None,
+    /,
+    *,
+    shape_cache: int | None = None,
+    fast: bool = False,
+    sample: float = 1.0,
+    first_n: int | None = None,
+    range_sample: float = 1.0,
+    out_pool: int | None = None,
+    executor: Executor | None = None,
+) -> Any:
+    '''
+    `shape_cache=n` memoizes the bindings of the last n distinct shape signatures,
+    calls repeating one of them skip `tensorshape` validation entirely.
+    `fast=True` binds the arguments and calls the validators inline instead of going through
+    pydantic's argument model, when every parameter is a plain type or `Annotated[type, *validators]`.
+    `sample` is the fraction of calls validated, `first_n` only validates the first n calls
+    of every distinct shape signature, other calls go straight to the undecorated function,
+    the counts of the `FIRST_N_SHAPES` most recently seen signatures are kept.
+    `range_sample` is the fraction of validated calls that also run data validators like `tensorange`.
+    An `out` parameter left out of a call is allocated with the shape of its `tensorshape`,
+    or of the return annotation, computed from the symbols the arguments bound,
+    so it can not be combined with `sample`, `first_n` or `HIRASAWA_VALIDATE=off`.
+    `out_pool=n` reuses those buffers instead, n (shape, dtype) per thread,
+    each is overwritten by the next call with the same shape.
+    A `tensorshape` return annotation also checks the returned value.
+    An `async def` function gets an async wrapper, its shapes are checked inline
+    while data validators like `tensorange` run on `executor`, the event loop's default one when None.
+    The returned function has `validate_many(arg_sets)` to check the shapes of many calls at once,
+    and pickles by reference, see `ValidatedFunction`.
+    '''
+    if func is None:
+        return lambda func: hirasawa_validate(
+            func,
+            shape_cache=shape_cache, fast=fast,
+            sample=sample, first_n=first_n, range_sample=range_sample, out_pool=out_pool, executor=executor,
+        )
+    skipping = 'HIRASAWA_VALIDATE=off' if _disabled() else 'sample' if sample < 1.0 else 'first_n' if first_n is not None else None
+    if skipping is not None and OutputSpec.of(func) is not None:
+        # calls that are not validated bind no symbols to allocate `out` with
+        raise TypeError(f'{func.__qualname__} allocates its `out` parameter, which {skipping} would skip on some calls')
+    if _disabled():
+        return func
+    options = dict(
+        shape_cache=shape_cache, fast=fast, sample=sample, first_n=first_n,
+        range_sample=range_sample, out_pool=out_pool, executor=executor,
+    )
+    slots = param_slots(func)
+    shape_slots = [
+        slot for slot in slots
+        if any(isinstance(validator, _TensorShapeValidator) for validator in slot.validators)
+    ]
+    plan = ValidationPlan(func, slots, out_pool)
+    if plan.nested_shapes or any(slot.kind in (Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD) for slot in shape_slots):
+        # the shapes of `*args`, or of values inside arguments like `list[...]`, can not be keyed by parameter
+        shape_cache = None
+    original = func
+    is_async = iscoroutinefunction(func)
+    func = plan.wrap(func, executor)  # runs the data validators right before the body
+    checked = func
+    # parameters annotated like ones decorated before reuse their schemas
+    func = validate_call(config={'arbitrary_types_allowed': True})(with_cached_schemas(func, _annotations(original)))
+    if fast:
+        func = wraps(func)(build_fast_call(checked, func) or func)
+    if plan.active:
+        validate_args = func
+
+        @wraps(validate_args)
+        def func(*args, **kwargs):
+            args, kwargs = plan.prepare(_scope_var.get(), args, kwargs)  # shapes first, in plan order
+            return validate_args(*args, **kwargs)
+    def new_scope(bindings: Bindings | None = None, shapes_checked: bool = False) -> ValidationScope:
+        return ValidationScope(bindings, shapes_checked, check_data=range_sample >= 1.0 or random() < range_sample)
+
+    if not shape_cache or not shape_slots:
+        if is_async:  # `func` returns the coroutine, the call is validated as it is awaited
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                scope = new_scope()
+                token = _scope_var.set(scope)
+                try:
+                    if instrumentation.enabled:
+                        return await _measured_call_async(original, scope, func, args, kwargs)
+                    return await func(*args, **kwargs)
+                finally:
+                    _scope_var.reset(token)
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                scope = new_scope()  # a fresh binding scope for this call only
+                token = _scope_var.set(scope)
+                try:
+                    if instrumentation.enabled:
+                        return _measured_call(original, scope, func, args, kwargs)
+                    return func(*args, **kwargs)
+                finally:
+                    _scope_var.reset(token)
+    else:
+        cache = ShapeCache(shape_cache)
+
+        if is_async:
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                key = _shape_key(shape_slots, args, kwargs)
+                cached = None if key is None else cache.get(key)
+                scope = new_scope() if cached is None else new_scope(dict(cached), shapes_checked=True)
+                token = _scope_var.set(scope)
+                try:
+                    if instrumentation.enabled:
+                        res = await _measured_call_async(original, scope, func, args, kwargs)
+                    else:
+                        res = await func(*args, **kwargs)
+                finally:
+                    _scope_var.reset(token)
+                if key is not None and cached is None:
+                    cache.put(key, dict(scope.bindings))
+                return res
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                key = _shape_key(shape_slots, args, kwargs)
+                cached = None if key is None else cache.get(key)
+                scope = new_scope() if cached is None else new_scope(dict(cached), shapes_checked=True)
+                token = _scope_var.set(scope)
+                try:
+                    if instrumentation.enabled:
+                        res = _measured_call(original, scope, func, args, kwargs)
+                    else:
+                        res = func(*args, **kwargs)
+                finally:
+                    _scope_var.reset(token)
+                if key is not None and cached is None:
+                    cache.put(key, dict(scope.bindings))
+                return res
+        wrapper.shape_cache_info = cache.info  # type: ignore
+        wrapper.shape_cache_clear = cache.clear  # type: ignore
+    def validate_many(arg_sets):
+        from .batch import validate_shapes_many  # numpy is only needed here
+        return validate_shapes_many(plan, arg_sets)
+    wrapper.validate_many = validate_many  # type: ignore
+    if sample >= 1.0 and first_n is None:
+        return ValidatedFunction(wrapper, original, options)
+
+    validate = wrapper
+    seen = ShapeCounter(FIRST_N_SHAPES)
+
+    def skipped(args: tuple, kwargs: dict) -> bool:
+        if sample < 1.0 and random() >= sample:
+            return True
+        if first_n is not None:
+            key = _shape_key(shape_slots, args, kwargs)
+            if key is not None and seen.count(key) >= first_n:
+                return True
+        return False
+
+    if is_async:
+        @wraps(validate)
+        async def sampled_wrapper(*args, **kwargs):
+            if skipped(args, kwargs):
+                return await original(*args, **kwargs)
+            return await validate(*args, **kwargs)
+    else:
+        @wraps(validate)
+        def sampled_wrapper(*args, **kwargs):
+            if skipped(args, kwargs):
+                return original(*args, **kwargs)
+            return validate(*args, **kwargs)
+    return ValidatedFunction(sampled_wrapper, original, options)
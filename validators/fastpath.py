@@ -0,0 +1,183 @@
+from inspect import Parameter
+from typing import Any, Annotated, Callable, get_args, get_origin
+
+from pydantic import ConfigDict, TypeAdapter, ValidationError
+from pydantic_core import InitErrorDetails, PydanticCustomError
+from pydantic_core.core_schema import ErrorType
+
+from . import instrumentation
+from .base_validators import BaseValidator
+from .signature import _MISSING, ParamSlot, _annotations, _signature, error_details
+
+
+_CONFIG = ConfigDict(arbitrary_types_allowed=True)
+_adapters: dict[Any, TypeAdapter] = {}  # by base type, shared by every fast path function
+_EXACT_TYPES = {'int': int, 'float': float, 'str': str, 'bool': bool, 'bytes': bytes}
+_ERROR_TYPES = frozenset(get_args(ErrorType))  # the others are raised by validators as `PydanticCustomError`
+
+
+def _adapter(base: Any) -> TypeAdapter:
+    try:
+        adapter = _adapters.get(base)
+    except TypeError:  # unhashable annotation
+        return TypeAdapter(base, config=_CONFIG)
+    if adapter is None:
+        adapter = _adapters.setdefault(base, TypeAdapter(base, config=_CONFIG))
+    return adapter
+
+
+class _FastParam(ParamSlot):
+    '''
+    One parameter of a fast path function.
+    Values failing the cheap inline type check go through a `TypeAdapter` of the base type,
+    which coerces or reports exactly like `validate_call` does.
+    '''
+    __slots__ = ('base', 'check', 'check_type', '_adapter')
+
+    def __init__(self, name: str, kind: Any, position: int | None, base: Any, validators: tuple[BaseValidator, ...]) -> None:
+        super().__init__(name, kind, position, validators)
+        self.base = base
+        self._adapter = _adapter(base)
+        schema = self._adapter.core_schema
+        # how the generated code checks the base type inline: 'any', 'exact', 'instance', 'optional' or 'adapter'
+        self.check: str
+        self.check_type: type | None = None
+        if schema['type'] == 'any':
+            self.check = 'any'
+        elif schema['type'] == 'is-instance':
+            self.check = 'instance'
+            self.check_type = schema['cls']
+        elif schema['type'] == 'nullable' and schema['schema']['type'] == 'is-instance':  # `NDArray | None`
+            self.check = 'optional'
+            self.check_type = schema['schema']['cls']
+        elif schema['type'] in _EXACT_TYPES and set(schema) <= {'type', 'metadata'}:
+            self.check = 'exact'
+            self.check_type = _EXACT_TYPES[schema['type']]
+        else:
+            self.check = 'adapter'
+
+    def coerce(self, value: Any, n_args: int, errors: list[InitErrorDetails]) -> Any:
+        try:
+            return self._adapter.validate_python(value)
+        except ValidationError as e:
+            for error in e.errors():
+                loc = (self.loc(n_args), *error['loc'])
+                if error['type'] not in _ERROR_TYPES:  # e.g. a nested `tensorshape` failing
+                    custom = PydanticCustomError(error['type'], error['msg'], error.get('ctx'))
+                    errors.append({'type': custom, 'loc': loc, 'input': error['input']})
+                    continue
+                details: InitErrorDetails = {'type': error['type'], 'loc': loc, 'input': error['input']}
+                if 'ctx' in error:
+                    details['ctx'] = error['ctx']
+                errors.append(details)
+            return _MISSING
+
+    def fail(self, e: Exception, value: Any, n_args: int, errors: list[InitErrorDetails]) -> None:
+        errors.append(error_details(e, self.loc(n_args), value))
+
+
+def _param_source(i: int, fast_param: _FastParam, has_default: bool, namespace: dict[str, Any]) -> list[str]:
+    name = f'_a{i}'  # never collides with the generated locals, whatever the parameter is called
+    namespace[f'_p{i}'] = fast_param
+    namespace[f'_t{i}'] = fast_param.check_type
+    body: list[str] = []
+    if fast_param.check == 'exact':
+        body += [f'if type({name}) is not _t{i}:', f'    {name} = _p{i}.coerce({name}, n_args, errors)']
+    elif fast_param.check == 'instance':
+        body += [f'if not isinstance({name}, _t{i}):', f'    {name} = _p{i}.coerce({name}, n_args, errors)']
+    elif fast_param.check == 'optional':
+        body += [f'if {name} is not None and not isinstance({name}, _t{i}):', f'    {name} = _p{i}.coerce({name}, n_args, errors)']
+    elif fast_param.check == 'adapter':
+        body += [f'{name} = _p{i}.coerce({name}, n_args, errors)']
+    if fast_param.validators:
+        lines = []
+        for j, validator in enumerate(fast_param.validators):
+            namespace[f'_v{i}_{j}'] = validator.validator_for(fast_param.base)
+            namespace[f'_o{i}_{j}'] = validator
+            lines.append(f'    {name} = _v{i}_{j}({name}) if not _instrumentation.enabled else _measure(_o{i}_{j}, {name}, _v{i}_{j})')
+        validate = [
+            'try:',
+            *lines,
+            'except (ValueError, AssertionError) as e:',
+            f'    _p{i}.fail(e, {name}, n_args, errors)',
+        ]
+        if fast_param.check == 'any':
+            body += validate
+        else:  # skipped when the type check already failed
+            body += [f'if {name} is not _MISSING:', *(f'    {line}' for line in validate)]
+    if has_default:  # defaults are not validated, same as validate_call
+        return [f'if {name} is _MISSING:', f'    {name} = _d{i}', *(['else:', *(f'    {line}' for line in body)] if body else [])]
+    return body
+
+
+def build_fast_call(func: Callable, fallback: Callable) -> Callable | None:
+    '''
+    A replacement of `validate_call(func)` that skips pydantic's argument model,
+    None when the signature of `func` is not simple enough:
+    every parameter must be unannotated, a plain type, or `Annotated[type, *hirasawa validators]`.
+    The returned function is generated from source so python binds the arguments natively.
+    Calls that do not bind (missing or unexpected arguments) go through `fallback`,
+    so every `ValidationError` matches the pydantic one.
+    '''
+    hints = _annotations(func)
+    namespace: dict[str, Any] = {
+        '_MISSING': _MISSING,
+        '_func': func,
+        '_fallback': fallback,
+        '_ValidationError': ValidationError,
+        '_title': func.__name__,
+        '_instrumentation': instrumentation,
+        '_measure': instrumentation.measure_validator,
+    }
+    parameters = list(_signature(func).parameters.values())
+    bind_params: list[str] = []
+    call_args: list[str] = []
+    body: list[str] = []
+    for i, param in enumerate(parameters):
+        if param.kind in (Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD):
+            return None
+        annotation = hints.get(param.name, Any)
+        validators: tuple = ()
+        if get_origin(annotation) is Annotated:
+            annotation, *metadata = get_args(annotation)
+            if not all(isinstance(meta, BaseValidator) for meta in metadata):
+                return None
+            validators = tuple(metadata)
+        try:
+            fast_param = _FastParam(
+                param.name,
+                param.kind,
+                i if param.kind != Parameter.KEYWORD_ONLY else None,
+                annotation,
+                validators,
+            )
+        except Exception:
+            return None  # let validate_call build or reject it
+        has_default = param.default is not Parameter.empty
+        namespace[f'_d{i}'] = param.default
+        if param.kind == Parameter.KEYWORD_ONLY and '*' not in bind_params:
+            bind_params.append('*')
+        bind_params.append(f'{param.name}=_MISSING' if has_default else param.name)
+        if param.kind == Parameter.POSITIONAL_ONLY and (i + 1 == len(parameters) or parameters[i + 1].kind != Parameter.POSITIONAL_ONLY):
+            bind_params.append('/')
+        call_args.append(f'_a{i}' if param.kind != Parameter.KEYWORD_ONLY else f'{param.name}=_a{i}')
+        body += _param_source(i, fast_param, has_default, namespace)
+    names = [f'_a{i}' for i in range(len(parameters))]
+    unpack = f'{", ".join(names)}{"," if len(names) == 1 else ""}'
+    source = '\n'.join([
+        f'def _bind({", ".join(bind_params)}):',
+        f'    return ({", ".join(param.name for param in parameters)}{"," if len(parameters) == 1 else ""})',
+        'def fast_call(*args, **kwargs):',
+        '    try:',
+        f'        {unpack} = _bind(*args, **kwargs)' if names else '        _bind(*args, **kwargs)',
+        '    except TypeError:',
+        '        return _fallback(*args, **kwargs)',
+        '    n_args = len(args)',
+        '    errors = []',
+        *(f'    {line}' for line in body),
+        '    if errors:',
+        '        raise _ValidationError.from_exception_data(_title, errors)',
+        f'    return _func({", ".join(call_args)})',
+    ])
+    exec(source, namespace)
+    return namespace['fast_call']
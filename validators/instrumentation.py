@@ -0,0 +1,182 @@
+'''
+Opt-in timing and counters of validators and `hirasawa_validate` functions.
+
+    from validators import instrumentation
+    instrumentation.enable()
+    ...
+    instrumentation.snapshot()     # {'tensorshape[2*W, 2*H]': {'calls': ..., 'p99_us': ...}, ...}
+    instrumentation.export_text()  # prometheus text format
+
+When disabled every call site only reads `instrumentation.enabled`.
+'''
+from collections import deque
+from threading import Lock
+from time import perf_counter_ns
+from typing import Any, Callable, NamedTuple
+
+from .scope import _scope_var
+
+
+enabled: bool = False
+
+
+class Measurement(NamedTuple):
+    name: str
+    kind: str  # 'validator' or 'function'
+    elapsed_ns: int
+    failed: bool
+
+
+type Sink = Callable[[Measurement], None]
+
+_sink: Sink | None = None
+
+
+class Stats:
+    '''
+    Counters of one validator instance or decorated function.
+    Percentiles are computed over the last `window` calls.
+    '''
+    window = 4096
+
+    def __init__(self, name: str, kind: str) -> None:
+        self.name = name
+        self.kind = kind
+        self.calls = 0
+        self.failures = 0
+        self.total_ns = 0
+        self.validation_ns = 0  # functions only, time spent in validators
+        self._samples: deque[int] = deque(maxlen=self.window)
+        self._lock = Lock()
+
+    def record(self, elapsed_ns: int, failed: bool, validation_ns: int = 0) -> None:
+        with self._lock:
+            self.calls += 1
+            self.failures += failed
+            self.total_ns += elapsed_ns
+            self.validation_ns += validation_ns
+            self._samples.append(elapsed_ns)
+        if _sink is not None:
+            _sink(Measurement(self.name, self.kind, elapsed_ns, failed))
+
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(q / 100 * len(samples)))] / 1000
+
+    def snapshot(self) -> dict[str, Any]:
+        snapshot = {
+            'kind': self.kind,
+            'calls': self.calls,
+            'failures': self.failures,
+            'total_us': self.total_ns / 1000,
+            'p50_us': self.percentile(50),
+            'p90_us': self.percentile(90),
+            'p99_us': self.percentile(99),
+        }
+        if self.kind == 'function':
+            snapshot['validation_us'] = self.validation_ns / 1000
+        return snapshot
+
+
+_registry: dict[int, tuple[Any, Stats]] = {}
+_registry_lock = Lock()
+
+
+def stats_of(obj: Any, name: str, kind: str) -> Stats:
+    entry = _registry.get(id(obj))
+    if entry is None or entry[0] is not obj:
+        with _registry_lock:
+            entry = (obj, Stats(name, kind))  # holds `obj`, so its id is never reused
+            _registry[id(obj)] = entry
+    return entry[1]
+
+
+def measure_validator(validator: Any, value: Any, validate: Callable[[Any], Any] | None = None) -> Any:
+    '''
+    Call `validate(value)`, `validator.validate` by default, recording its time into the validator's stats
+    and into the validation time of the current call.
+    '''
+    if validate is None:
+        validate = validator.validate
+    if validator.skipped():
+        return validate(value)
+    start = perf_counter_ns()
+    failed = True
+    try:
+        value = validate(value)
+        failed = False
+        return value
+    finally:
+        record_validator(validator, perf_counter_ns() - start, failed)
+
+
+def record_validator(validator: Any, elapsed_ns: int, failed: bool) -> None:
+    '''
+    Record a validation done on behalf of `validator`, e.g. by a validation plan.
+    '''
+    stats_of(validator, repr(validator), 'validator').record(elapsed_ns, failed)
+    scope = _scope_var.get()
+    if scope is not None:
+        scope.validation_ns += elapsed_ns
+
+
+def enable(sink: Sink | None = None) -> None:
+    '''
+    Start recording, every measurement is also passed to `sink` when given.
+    '''
+    global enabled, _sink
+    _sink = sink
+    enabled = True
+
+
+def disable() -> None:
+    global enabled, _sink
+    enabled = False
+    _sink = None
+
+
+def reset() -> None:
+    with _registry_lock:
+        _registry.clear()
+
+
+def snapshot() -> dict[str, dict[str, Any]]:
+    with _registry_lock:
+        entries = list(_registry.values())
+    result: dict[str, dict[str, Any]] = {}
+    for _, stats in entries:
+        name = stats.name
+        while name in result:  # equal specs on different parameters
+            name += "'"
+        result[name] = stats.snapshot()
+    return result
+
+
+def export_text() -> str:
+    '''
+    The snapshot in prometheus text exposition format.
+    '''
+    lines = []
+    metrics = [
+        ('calls', 'counter', 'calls'),
+        ('failures', 'counter', 'failures'),
+        ('total_us', 'counter', 'seconds_total'),
+        ('p50_us', 'gauge', 'p50_seconds'),
+        ('p90_us', 'gauge', 'p90_seconds'),
+        ('p99_us', 'gauge', 'p99_seconds'),
+        ('validation_us', 'counter', 'validation_seconds_total'),
+    ]
+    current = snapshot()
+    for key, kind, suffix in metrics:
+        metric = f'hirasawa_{suffix}'
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, values in current.items():
+            if key not in values:
+                continue
+            value = values[key] / 1e6 if key.endswith('_us') else values[key]
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'{metric}{{name="{label}",kind="{values["kind"]}"}} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,74 @@
+import sys
+from types import UnionType
+from typing import Annotated, Any, ClassVar, Union, get_args, get_origin
+
+from pydantic import BaseModel, ConfigDict, GetCoreSchemaHandler
+from pydantic_core import CoreSchema, PydanticCustomError, core_schema
+
+from .scope import ValidationScope, _scope_var
+from .shapecompiler import Deferred
+from .tensorshape import _TensorShapeValidator
+
+
+def _shape_validators(annotation: Any, repeated: bool = False) -> list[tuple[_TensorShapeValidator, bool]]:
+    # also inside unions and containers, like `Annotated[NDArray, tensorshape[N]] | None`,
+    # with whether it may check several values, like in `list[Annotated[NDArray, tensorshape[N]]]`
+    found = []
+    if get_origin(annotation) is Annotated:
+        found += [(meta, repeated) for meta in annotation.__metadata__ if isinstance(meta, _TensorShapeValidator)]
+        annotation = annotation.__origin__
+    container = get_origin(annotation) not in (None, Union, UnionType)
+    for arg in get_args(annotation):
+        found += _shape_validators(arg, repeated or container)
+    return found
+
+
+class ShapedModel(BaseModel):
+    '''
+    A `BaseModel` whose fields share `tensorshape` symbols, e.g. `x: Annt[NDArray, tensorshape[N, F]]`
+    and `y: Annt[NDArray, tensorshape[N]]` must agree on `N`, like the parameters of a `hirasawa_validate` function.
+    Every validated instance gets its own scope, a nested model its own symbols,
+    and `current_bindings()` gives the bindings to field and model validators.
+    Constraints are compiled when the validators are created, so validating a `list[Model]`
+    with a `TypeAdapter` does no sympy work per record.
+    '''
+    model_config = ConfigDict(arbitrary_types_allowed=True)  # tensors are not pydantic types
+
+    # the number of `tensorshape` validators on the fields, and whether some have several unknown symbols
+    __shape_checks__: ClassVar[int] = 0
+    __shape_deferrable__: ClassVar[bool] = False
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any) -> None:
+        super().__pydantic_init_subclass__(**kwargs)
+        shapes = [
+            shape for field in cls.model_fields.values()
+            for shape in _shape_validators(Annotated[field.annotation, *field.metadata] if field.metadata else field.annotation)
+        ]
+        # with a count that is not known, the deferred equations are only solved once the model is validated
+        cls.__shape_checks__ = sys.maxsize if any(repeated for _, repeated in shapes) else len(shapes)
+        cls.__shape_deferrable__ = any(validator._deferrable for validator, _ in shapes)
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler: GetCoreSchemaHandler) -> CoreSchema:
+        # around the model validators too, which pydantic applies outside of those of the base classes
+        return core_schema.no_info_wrap_validator_function(cls._shape_scope, handler(source))
+
+    @classmethod
+    def _shape_scope(cls, data: Any, handler: core_schema.ValidatorFunctionWrapHandler) -> Any:
+        scope = ValidationScope()
+        if cls.__shape_deferrable__:
+            scope.deferred = Deferred()
+            scope.pending_shapes = cls.__shape_checks__
+        token = _scope_var.set(scope)
+        try:
+            model = handler(data)
+            # fields left to their defaults are not validated, the last check never came
+            if scope.deferred is not None and scope.pending_shapes > 0:
+                try:
+                    scope.deferred.finish(scope.bindings)
+                except ValueError as e:
+                    raise PydanticCustomError('tensor-shape-mismatch', f'This model {e}')
+            return model
+        finally:
+            _scope_var.reset(token)
@@ -1,16 +1,28 @@
 from pydantic_core import PydanticCustomError
 from typing import override, Any
 
-from .base_validators import SubscriptableValidator  # type: ignore
+from .base_validators import SubscriptableValidator, _range_text  # type: ignore
 
 
 class _NumRangeValidator(SubscriptableValidator):
-    def __init__(self, _range: slice):
+    def __init__(self, _range: slice, max_indices: int = 10):
+        '''
+        A list, tuple or array is checked as a whole, in one vectorized pass over a numpy array,
+        its error reports the first `max_indices` offending indices.
+        `nrange(max_indices=3)[0:1]` sets the cap, numpy is imported on the first container.
+        '''
         self._min_val = float('-inf') if _range.start is None else _range.start
         self._max_val = float('inf') if _range.stop is None else _range.stop
+        self._range = _range
+        self._max_indices = max_indices
+
+    def __repr__(self) -> str:
+        return f'nrange[{_range_text(self._range.start, self._range.stop)}]'
     
     @override
     def validate[T: int | float](self, value: T) -> T:
+        if not isinstance(value, (int, float)) and (isinstance(value, (list, tuple)) or hasattr(value, '__array__')):
+            return self.validate_many(value)
         if not self._min_val <= value < self._max_val:
             raise PydanticCustomError(
                 'interval_error',
@@ -18,6 +30,39 @@ class _NumRangeValidator(SubscriptableValidator):
                 {'value': value, 'range': (self._min_val, self._max_val)}
             )
         return value
+
+    def validate_many(self, value: Any) -> Any:
+        import numpy as np
+        from . import reductions
+        array = np.asarray(value)
+        if array.ndim == 0:
+            self.validate(array.item())
+            return value
+        if array.dtype.kind not in 'biuf':
+            raise PydanticCustomError(
+                'interval_error',
+                f'This {type(value).__name__} object should hold real numbers, got dtype {array.dtype}',
+                {'range': (self._min_val, self._max_val)}
+            )
+        if array.size == 0:
+            return value
+        result = reductions.minmax(array)  # no temporary arrays unless some value is out of range
+        if not result.has_nan and self._min_val <= result.min and result.max < self._max_val:
+            return value
+        bad = ~((array >= self._min_val) & (array < self._max_val))  # NaN is out of every range
+        count = int(np.count_nonzero(bad))
+        if array.ndim == 1:
+            indices: list = np.flatnonzero(bad)[:self._max_indices].tolist()
+        else:
+            indices = [tuple(index) for index in np.argwhere(bad)[:self._max_indices].tolist()]
+        values = [array[index].item() for index in indices]
+        more = ', ...' if count > len(indices) else ''
+        raise PydanticCustomError(
+            'interval_error',
+            f'This {type(value).__name__} object should be in range [{self._min_val}, {self._max_val}), '
+            f'{count} of its {array.size} values are not, at indices [{", ".join(map(str, indices))}{more}]',
+            {'indices': indices, 'values': values, 'count': count, 'range': (self._min_val, self._max_val)}
+        )
         
 
-nrange = _NumRangeValidator.subscriptable()
\ No newline at end of file
+nrange = _NumRangeValidator.subscriptable()
@@ -0,0 +1,147 @@
+from inspect import Parameter
+from threading import local
+from types import UnionType
+from typing import Annotated, Any, Callable, Union, get_args, get_origin
+
+from .shapecompiler import Bindings, _ConstDim, _ExprDim, _Form
+from .signature import _MISSING, ParamSlot, _annotations, _signature, validators_of
+from .tensorshape import _TensorShapeValidator
+
+
+OUT = 'out'
+
+
+def _shape_validator(annotation: Any) -> _TensorShapeValidator | None:
+    return next((v for v in validators_of(annotation) if isinstance(v, _TensorShapeValidator)), None)
+
+
+def _dtype_of(annotation: Any) -> Any:
+    '''
+    `np.float64` of `Annotated[NDArray[np.float64], ...]` or `NDArray[np.float64] | None`,
+    None when the annotation does not say.
+    '''
+    if get_origin(annotation) is Annotated:
+        annotation = get_args(annotation)[0]
+    args = get_args(annotation)
+    if get_origin(annotation) in (Union, UnionType):
+        return next((dtype for arg in args if (dtype := _dtype_of(arg)) is not None), None)
+    if len(args) == 1 and isinstance(args[0], type):  # NDArray[scalar]
+        return args[0]
+    if len(args) == 2:  # ndarray[shape, dtype[scalar]]
+        scalar = get_args(args[1])
+        if scalar and isinstance(scalar[0], type):
+            return scalar[0]
+    return None
+
+
+class BufferPool:
+    '''
+    Output buffers reused across calls, at most `maxsize` distinct (shape, dtype) per thread,
+    the oldest one is dropped for a new one.
+    A pooled buffer is overwritten by the next call of the same thread with the same shape.
+    '''
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._local = local()
+
+    def get(self, shape: tuple[int, ...], dtype: Any) -> Any:
+        try:
+            buffers: dict[tuple, Any] = self._local.buffers
+        except AttributeError:
+            buffers = self._local.buffers = {}
+        key = (shape, dtype)
+        buffer = buffers.get(key)
+        if buffer is None:
+            import numpy as np
+            if len(buffers) >= self.maxsize:
+                del buffers[next(iter(buffers))]
+            buffer = buffers[key] = np.empty(shape, dtype)
+        return buffer
+
+
+class OutputSpec:
+    '''
+    The `out` parameter of a function whose shape follows from the bindings of a call,
+    given by the `tensorshape` of `out` or else of the return annotation, e.g.
+
+        def func(x: Annotated[NDArray, tensorshape[W, H]], out: NDArray | None = None) -> Annotated[NDArray, tensorshape[2*W, H]]
+
+    Calls leaving `out` out or None get a buffer of that shape, new or from `pool`.
+    '''
+    def __init__(
+        self,
+        slot: ParamSlot,
+        validator: _TensorShapeValidator,
+        dtype: Any,
+        pool: BufferPool | None,
+        checks_out: bool = False,
+    ) -> None:
+        self.slot = slot
+        self.validator = validator
+        self.dtype = dtype
+        self.pool = pool
+        self.checks_out = checks_out
+        self._dims: list[int | _Form] = [
+            constraint.size if isinstance(constraint, _ConstDim) else constraint.form  # type: ignore
+            for constraint in validator._constraints
+        ]
+
+    @classmethod
+    def of(cls, func: Callable, pool_size: int | None = None) -> 'OutputSpec | None':
+        '''
+        None when `func` has no `out` parameter or its shape can not be computed from symbols.
+        '''
+        parameters = list(_signature(func).parameters.values())
+        param = next((param for param in parameters if param.name == OUT), None)
+        if param is None or param.kind in (Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD):
+            return None
+        hints = _annotations(func)
+        validator = _shape_validator(hints.get(OUT))
+        checks_out = validator is None  # `out` has no `tensorshape` of its own to check passed buffers
+        if validator is None:
+            validator = _shape_validator(hints.get('return'))
+        if validator is None or not all(isinstance(constraint, (_ConstDim, _ExprDim)) for constraint in validator._constraints):
+            return None
+        position = None
+        if param.kind != Parameter.KEYWORD_ONLY:
+            position = parameters.index(param)
+        pool = BufferPool(pool_size) if pool_size else None
+        dtype = _dtype_of(hints.get(OUT))
+        if dtype is None:
+            dtype = _dtype_of(hints.get('return'))
+        return cls(ParamSlot(OUT, param.kind, position, ()), validator, dtype, pool, checks_out)
+
+    def missing(self, args: tuple, kwargs: dict) -> bool:
+        value = self.slot.fetch(args, kwargs)
+        return value is _MISSING or value is None
+
+    def shape(self, bindings: Bindings) -> tuple[int, ...] | None:
+        shape = []
+        for dim in self._dims:
+            size = dim if isinstance(dim, int) else dim.value(bindings)
+            if type(size) is not int:
+                if size is None or size.denominator != 1:
+                    return None
+                size = size.numerator
+            if size < 0:
+                return None
+            shape.append(size)
+        return tuple(shape)
+
+    def allocate(self, bindings: Bindings, args: tuple, kwargs: dict) -> tuple[tuple, dict]:
+        '''
+        The arguments of the call with the buffer passed as `out`,
+        unchanged when some symbol of its shape is unbound.
+        '''
+        shape = self.shape(bindings)
+        if shape is None:
+            return args, kwargs
+        if self.pool is not None:
+            buffer = self.pool.get(shape, self.dtype)
+        else:
+            import numpy as np
+            buffer = np.empty(shape, self.dtype)
+        position = self.slot.position
+        if position is not None and position < len(args):  # `out=None` passed positionally
+            return (*args[:position], buffer, *args[position + 1:]), kwargs
+        return args, {**kwargs, OUT: buffer}
@@ -0,0 +1,324 @@
+'''
+The order a `hirasawa_validate` function checks its arguments in, decided once at decoration time:
+
+1. the number of dimensions and the constant sizes of every `tensorshape` argument,
+2. the symbolic sizes, each once the symbols it needs are bound, whichever argument binds them,
+3. the rest of the argument validation (types, `nrange`, ...),
+4. validators reading the data, like `tensorange`, right before the function body,
+   on an executor for `async def` functions so they do not block the event loop,
+5. the shape of the returned value, when the return annotation has a `tensorshape`.
+
+A call failing a shape never pays for reading the data of an argument.
+An `out` parameter left out of a call is allocated from the bindings of its shapes, see `OutputSpec`.
+'''
+import sys
+from asyncio import get_running_loop
+from concurrent.futures import Executor
+from contextvars import copy_context
+from functools import wraps
+from inspect import Parameter, iscoroutinefunction
+from time import perf_counter_ns
+from typing import Any, Callable, Iterable, NamedTuple
+
+from pydantic import ValidationError
+from pydantic_core import PydanticCustomError
+
+from . import instrumentation
+from .base_validators import BaseValidator
+from .output import OutputSpec, _shape_validator
+from .protocols import shape_of
+from .scope import ValidationScope, _scope_var
+from .shapecompiler import Deferred, DimConstraint, _AnyDim, _RangeDim
+from .signature import _MISSING, ParamSlot, _annotations, _signature, error_details, nested_validators
+from .tensorshape import _TensorShapeValidator
+
+
+class ShapeStep(NamedTuple):
+    slot: int  # index into `ValidationPlan.shape_slots`
+    validator: _TensorShapeValidator
+    dim: int
+    constraint: DimConstraint | None  # None solves the deferred equations
+
+
+def _symbols(step: ShapeStep) -> tuple[str, ...]:
+    # only the step solving the deferred equations has no constraint, `_order` adds it last
+    return () if step.constraint is None else step.constraint.symbols
+
+
+def _order(steps: list[ShapeStep]) -> tuple[list[ShapeStep], bool]:
+    '''
+    Constant sizes first, then every symbolic size as soon as the symbols it needs are bound.
+    Sizes with several unknown symbols, like `X + Y`, are deferred and solved together,
+    ranges over symbols only they bind come after. Also returns whether anything is deferred.
+    '''
+    ordered = [step for step in steps if not _symbols(step)]
+    rest = [step for step in steps if _symbols(step)]
+    known: set[str] = set()
+
+    def ready(step: ShapeStep) -> bool:
+        unknown = [name for name in _symbols(step) if name not in known]
+        return not unknown if isinstance(step.constraint, _RangeDim) else len(unknown) <= 1
+
+    while (step := next((step for step in rest if ready(step)), None)) is not None:
+        ordered.append(step)
+        rest.remove(step)
+        if not isinstance(step.constraint, _RangeDim):
+            known.update(_symbols(step))
+    deferred = [step for step in rest if not isinstance(step.constraint, _RangeDim)]
+    if deferred:
+        ordered += deferred
+        ordered.append(ShapeStep(deferred[-1].slot, deferred[-1].validator, -1, None))
+    ordered += [step for step in rest if isinstance(step.constraint, _RangeDim)]
+    return ordered, bool(deferred)
+
+
+def _shape_checks(slots: list[tuple[ParamSlot, int]], n_positional: int, named: set[str], args: tuple, kwargs: dict) -> int:
+    '''
+    How many `tensorshape` checks validating this call runs, given the number of them on every slot
+    and the number of positional parameters before `*args`.
+    '''
+    total = 0
+    for slot, count in slots:
+        if slot.kind == Parameter.VAR_POSITIONAL:
+            total += count * max(0, len(args) - n_positional)
+        elif slot.kind == Parameter.VAR_KEYWORD:
+            total += count * sum(name not in named for name in kwargs)
+        elif slot.fetch(args, kwargs) is not _MISSING:
+            total += count
+    return total
+
+
+class ValidationPlan:
+    '''
+    Checks the shapes of a call up front and runs its data validators last.
+    `*args` and `**kwargs` are left to the argument validation, in parameter order.
+    '''
+    def __init__(self, func: Callable, slots: list[ParamSlot], out_pool: int | None = None) -> None:
+        self.title = func.__name__
+        self.output = OutputSpec.of(func, out_pool)
+        self.returns = _shape_validator(_annotations(func).get('return'))
+        self.shape_slots: list[tuple[ParamSlot, list[_TensorShapeValidator]]] = [
+            (slot, [validator for validator in slot.validators if isinstance(validator, _TensorShapeValidator)])
+            for slot in slots
+        ]
+        self.shape_slots = [(slot, validators) for slot, validators in self.shape_slots if validators]
+        self.data_slots: list[tuple[ParamSlot, list[BaseValidator]]] = [
+            (slot, [validator for validator in slot.validators if validator.reads_data])
+            for slot in slots
+            if slot.kind not in (Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD)
+        ]
+        self.data_slots = [(slot, validators) for slot, validators in self.data_slots if validators]
+        # `ordered` is also how `validate_many` checks a batch, `steps` is None when calls can not follow it
+        self.ordered, self.deferrable = _order([
+            ShapeStep(i, validator, dim, constraint)
+            for i, (_, validators) in enumerate(self.shape_slots)
+            for validator in validators
+            for dim, constraint in enumerate(validator._constraints)
+            if not isinstance(constraint, _AnyDim)
+        ])
+        self.steps: list[ShapeStep] | None = self.ordered
+        # `tensorshape` validators count down to the last one of a call, which solves the deferred equations
+        self.counted_slots: list[tuple[ParamSlot, int]] | None = None
+        self.named = set(_signature(func).parameters)
+        self.n_positional = sum(
+            param.kind in (Parameter.POSITIONAL_ONLY, Parameter.POSITIONAL_OR_KEYWORD)
+            for param in _signature(func).parameters.values()
+        )
+        # `tensorshape` inside other annotations, like `Annotated[NDArray, tensorshape[W]] | None`,
+        # checked by pydantic on parts of the value, so the plan can not check the shapes of the call up front
+        self.nested_shapes = [
+            validator for name, hint in _annotations(func).items() if name != 'return'
+            for validator in nested_validators(hint) if isinstance(validator, _TensorShapeValidator)
+        ]
+        if self.nested_shapes or any(
+            slot.kind in (Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD)
+            or any(validator._split != validators[0]._split for validator in validators)  # one shape per slot
+            for slot, validators in self.shape_slots
+        ):
+            self.steps = None
+            self.deferrable = any(
+                validator._deferrable
+                for validator in [*self.nested_shapes, *(validator for _, validators in self.shape_slots for validator in validators)]
+            )
+        if self.deferrable:
+            self.counted_slots = [(slot, len(validators)) for slot, validators in self.shape_slots]
+
+    def _fail(self, slot: ParamSlot, n_args: int, value: Any, e: Exception) -> ValidationError:
+        return ValidationError.from_exception_data(self.title, [error_details(e, slot.loc(n_args), value)])
+
+    def check_shapes(self, scope: ValidationScope, args: tuple, kwargs: dict) -> bool:
+        '''
+        Check every `tensorshape` of the call in plan order, raise ValidationError at the first mismatch.
+        False when some argument is not tensor-like, the argument validation reports it then.
+        '''
+        assert self.steps is not None
+        values = []
+        shapes: list[tuple[int, ...]] = []
+        for slot, validators in self.shape_slots:
+            value = slot.fetch(args, kwargs)
+            if value is None and self.output is not None and slot.name == self.output.slot.name:
+                value = _MISSING  # allocated once the shapes are checked
+            try:  # defaults are not validated
+                shape = () if value is _MISSING else validators[0].shape_of(value)
+            except PydanticCustomError as e:  # shards that do not make up one tensor
+                raise self._fail(slot, len(args), value, e)
+            if shape is None:
+                if not isinstance(value, Iterable):
+                    return False
+                value = _MISSING  # a stream of tensors, checked item by item as it is pulled
+            values.append(value)
+            shapes.append(shape)  # type: ignore
+        # with instrumentation enabled, the time of every step is recorded to its `tensorshape`
+        timed = instrumentation.enabled
+        spent: dict[_TensorShapeValidator, int] = {}
+        failing = None
+        try:
+            for (slot, validators), value, shape in zip(self.shape_slots, values, shapes):
+                if value is _MISSING:
+                    continue
+                for validator in validators:
+                    if len(shape) != len(validator._size):
+                        failing = validator
+                        error = validator.mismatch(value, f'This tensor-like object must have {len(validator._size)} dimensions, which shape is {shape}')
+                        raise self._fail(slot, len(args), value, error)
+            bindings = scope.bindings
+            deferred = Deferred() if self.deferrable else None
+            for i, validator, dim, constraint in self.steps:
+                value = values[i]
+                if value is _MISSING:
+                    continue
+                start = perf_counter_ns() if timed else 0
+                try:
+                    if constraint is None:
+                        deferred.finish(bindings)  # type: ignore
+                    else:
+                        constraint.check(bindings, shapes[i][dim], deferred)
+                except ValueError as e:
+                    failing = validator
+                    message = f'This call {e}' if constraint is None else f'The {dim}-th dimension of this tensor-like object {e}'
+                    raise self._fail(self.shape_slots[i][0], len(args), value, validator.mismatch(value, message))
+                finally:
+                    if timed:
+                        spent[validator] = spent.get(validator, 0) + perf_counter_ns() - start
+        finally:
+            if timed:
+                if failing is not None:
+                    spent.setdefault(failing, 0)
+                for validator, elapsed in spent.items():
+                    instrumentation.record_validator(validator, elapsed, validator is failing)
+        return True
+
+    def prepare(self, scope: ValidationScope, args: tuple, kwargs: dict) -> tuple[tuple, dict]:
+        '''
+        Run the shape checks and set up the rest of the plan for one call,
+        returns the arguments to validate, with the allocated `out` buffer.
+        '''
+        if not scope.shapes_checked and (self.shape_slots or self.nested_shapes):
+            if self.steps is not None and self.check_shapes(scope, args, kwargs):
+                scope.shapes_checked = True
+            elif self.counted_slots is not None:
+                scope.deferred = Deferred()
+                # the number of nested checks is not known, their equations are solved before the body
+                scope.pending_shapes = sys.maxsize if self.nested_shapes else _shape_checks(self.counted_slots, self.n_positional, self.named, args, kwargs)
+        if self.data_slots and scope.check_data:
+            scope.check_data = False
+            scope.data_deferred = True
+            scope.n_args = len(args)
+        if self.output is not None:
+            if self.output.missing(args, kwargs):
+                return self.output.allocate(scope.bindings, args, kwargs)
+            if self.output.checks_out:  # a passed buffer must have the shape of the return value
+                value = self.output.slot.fetch(args, kwargs)
+                try:
+                    if shape_of(value) is not None:
+                        self.output.validator.check_shape(value, dict(scope.bindings))
+                except PydanticCustomError as e:
+                    raise self._fail(self.output.slot, len(args), value, e)
+        return args, kwargs
+
+    def check_data(self, scope: ValidationScope, args: tuple, kwargs: dict) -> None:
+        '''
+        Run the data validators on the validated arguments, raise ValidationError at the first failure.
+        '''
+        scope.check_data = True
+        scope.data_deferred = False
+        for slot, validators in self.data_slots:
+            value = slot.fetch(args, kwargs)
+            if value is _MISSING:
+                continue
+            for validator in validators:
+                try:
+                    if instrumentation.enabled:
+                        value = instrumentation.measure_validator(validator, value)
+                    else:
+                        value = validator.validate(value)
+                except (ValueError, AssertionError) as e:
+                    raise self._fail(slot, scope.n_args, value, e)
+
+    def finish_shapes(self, scope: ValidationScope, args: tuple) -> None:
+        '''
+        Solve the deferred equations left by nested `tensorshape` checks, once every argument is validated.
+        '''
+        if scope.deferred is None:
+            return
+        try:
+            scope.deferred.finish(scope.bindings)
+        except ValueError as e:
+            error = PydanticCustomError('tensor-shape-mismatch', f'This call {e}')
+            raise ValidationError.from_exception_data(self.title, [{'type': error, 'loc': (), 'input': args}])
+
+    def check_return(self, scope: ValidationScope, value: Any) -> None:
+        assert self.returns is not None
+        try:
+            if shape_of(value) is None:
+                raise PydanticCustomError('tensor-shape-mismatch', f'The return value must be tensor-like, got {type(value).__name__}')
+            self.returns.check_shape(value, scope.bindings)
+        except PydanticCustomError as e:
+            raise ValidationError.from_exception_data(self.title, [{'type': e, 'loc': (), 'input': value}])
+
+    def wrap(self, func: Callable, executor: Executor | None = None) -> Callable:
+        '''
+        `func` running the deferred data validators first and checking its return value,
+        to be validated by `validate_call`.
+        A coroutine function runs its data validators on `executor`, the loop's default one when None.
+        '''
+        solves_late = bool(self.nested_shapes) and self.deferrable
+        if not self.data_slots and self.returns is None and not solves_late:
+            return func
+        output = self.output
+
+        def returns_out(result: Any, args: tuple, kwargs: dict) -> bool:
+            # the `out` buffer got the shape of the return annotation already
+            return output is not None and output.validator is self.returns and result is output.slot.fetch(args, kwargs)
+
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def checked_async(*args, **kwargs):
+                scope = _scope_var.get()
+                if scope is not None and solves_late:
+                    self.finish_shapes(scope, args)
+                if scope is not None and scope.data_deferred:
+                    # the worker thread sees the scope of this call through a copy of the context
+                    await get_running_loop().run_in_executor(executor, copy_context().run, self.check_data, scope, args, kwargs)
+                result = await func(*args, **kwargs)
+                if scope is not None and self.returns is not None and not returns_out(result, args, kwargs):
+                    self.check_return(scope, result)
+                return result
+            return checked_async
+
+        @wraps(func)
+        def checked(*args, **kwargs):
+            scope = _scope_var.get()
+            if scope is not None and solves_late:
+                self.finish_shapes(scope, args)
+            if scope is not None and scope.data_deferred:
+                self.check_data(scope, args, kwargs)
+            result = func(*args, **kwargs)
+            if scope is not None and self.returns is not None and not returns_out(result, args, kwargs):
+                self.check_return(scope, result)
+            return result
+        return checked
+
+    @property
+    def active(self) -> bool:
+        return bool(self.shape_slots or self.nested_shapes or self.data_slots or self.output)
@@ -1,8 +1,13 @@
 from __future__ import annotations
 
-from typing import Protocol, runtime_checkable, Sized, Iterable, SupportsIndex, Sequence
+from collections.abc import Buffer
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Protocol, runtime_checkable, Sized, Iterable, SupportsIndex, Sequence
 
-from numpy import ndarray
+from pydantic_core import PydanticCustomError
+
+if TYPE_CHECKING:
+    from numpy import ndarray
 
 
 @runtime_checkable
@@ -31,4 +36,133 @@ class TensorProtocol[DType](Protocol, Sized, Iterable):
         /,
         axis: SupportsIndex | Sequence[SupportsIndex] | None = None,
         **kwargs
-    ) -> DType | ndarray: pass
\ No newline at end of file
+    ) -> DType | ndarray: pass
+
+
+# `isinstance` of a runtime protocol looks up every member each time, the answer is kept per type
+_tensor_types: dict[type, bool] = {}
+
+
+def is_tensor(value: Any) -> bool:
+    '''
+    `isinstance(value, TensorProtocol)`, decided once per type.
+    '''
+    cls = type(value)
+    result = _tensor_types.get(cls)
+    if result is None:
+        result = _tensor_types[cls] = isinstance(value, TensorProtocol)
+    return result
+
+
+def _interface_shape(value: Any) -> tuple[int, ...]:
+    return tuple(value.__array_interface__['shape'])
+
+
+def _cuda_interface_shape(value: Any) -> tuple[int, ...]:
+    return tuple(value.__cuda_array_interface__['shape'])
+
+
+def _buffer_shape(value: Any) -> tuple[int, ...]:
+    with memoryview(value) as view:
+        return view.shape or ()
+
+
+@lru_cache(maxsize=1)
+def _dlpack_api() -> tuple[Any, Any, Any, Any]:
+    import ctypes
+
+    class DLTensor(ctypes.Structure):  # head of `DLManagedTensor`
+        _fields_ = [
+            ('data', ctypes.c_void_p),
+            ('device_type', ctypes.c_int32),
+            ('device_id', ctypes.c_int32),
+            ('ndim', ctypes.c_int32),
+            ('code', ctypes.c_uint8),
+            ('bits', ctypes.c_uint8),
+            ('lanes', ctypes.c_uint16),
+            ('shape', ctypes.POINTER(ctypes.c_int64)),
+        ]
+
+    class DLTensorVersioned(ctypes.Structure):  # head of `DLManagedTensorVersioned`, DLPack 1.0
+        _fields_ = [
+            ('major', ctypes.c_uint32),
+            ('minor', ctypes.c_uint32),
+            ('manager_ctx', ctypes.c_void_p),
+            ('deleter', ctypes.c_void_p),
+            ('flags', ctypes.c_uint64),
+            ('dl_tensor', DLTensor),
+        ]
+
+    get_pointer = ctypes.pythonapi.PyCapsule_GetPointer
+    get_pointer.restype = ctypes.c_void_p
+    get_pointer.argtypes = [ctypes.py_object, ctypes.c_char_p]
+    is_valid = ctypes.pythonapi.PyCapsule_IsValid
+    is_valid.restype = ctypes.c_int
+    is_valid.argtypes = [ctypes.py_object, ctypes.c_char_p]
+    return DLTensor, DLTensorVersioned, get_pointer, is_valid
+
+
+def _dlpack_shape(value: Any) -> tuple[int, ...]:
+    # the capsule is not consumed, its destructor hands the tensor back to the producer
+    DLTensor, DLTensorVersioned, get_pointer, is_valid = _dlpack_api()
+    try:
+        try:  # DLPack 1.0 also exports read-only tensors
+            capsule = value.__dlpack__(max_version=(1, 0))
+        except TypeError:  # a producer from before DLPack 1.0
+            capsule = value.__dlpack__()
+    except BufferError as e:  # e.g. a dtype DLPack can not describe
+        raise PydanticCustomError(
+            'tensor-shape-mismatch',
+            f'This {type(value).__name__} object does not export its shape through DLPack: {e}',
+            {'value': type(value).__name__},
+        )
+    if is_valid(capsule, b'dltensor_versioned'):
+        tensor = DLTensorVersioned.from_address(get_pointer(capsule, b'dltensor_versioned')).dl_tensor
+    else:
+        tensor = DLTensor.from_address(get_pointer(capsule, b'dltensor'))
+    return tuple(tensor.shape[i] for i in range(tensor.ndim))
+
+
+def _shape_reader(value: Any) -> Callable[[Any], tuple[int, ...]] | None:
+    if hasattr(value, '__array_interface__'):
+        return _interface_shape
+    if hasattr(value, '__cuda_array_interface__'):
+        return _cuda_interface_shape
+    if hasattr(value, '__dlpack__'):
+        return _dlpack_shape
+    if isinstance(value, Buffer):
+        return _buffer_shape
+    return None
+
+
+_shape_readers: dict[type, Callable[[Any], tuple[int, ...]] | None] = {}
+
+
+def shape_of(value: Any) -> tuple[int, ...] | None:
+    '''
+    Shape of a tensor-like object, or of an object exposing `__array_interface__`, `__cuda_array_interface__`,
+    `__dlpack__` or the buffer protocol, read from its metadata without converting or copying its data.
+    None for other objects, PydanticCustomError when a DLPack producer refuses to export it.
+    How to read it is decided once per type.
+    '''
+    if is_tensor(value):
+        return value.shape
+    cls = type(value)
+    try:
+        reader = _shape_readers[cls]
+    except KeyError:
+        reader = _shape_readers[cls] = _shape_reader(value)
+    return None if reader is None else reader(value)
+
+
+def describe(value: Any) -> str:
+    '''
+    The type and shape of `value` for error details, the number of shards of a sequence of them.
+    '''
+    try:
+        shape = shape_of(value)
+    except PydanticCustomError:
+        return type(value).__name__
+    if shape is None and isinstance(value, (list, tuple)):
+        return f'{type(value).__name__} of {len(value)} shards'
+    return f'{type(value).__name__} {shape}'
@@ -0,0 +1,101 @@
+'''
+Min / max of numpy arrays over read-only buffers, kept while the array owning their memory is alive,
+so a chain of functions checking the range of the same frozen array reads it once.
+
+An entry is keyed by what identifies the viewed data: the data pointer, shape, strides and dtype,
+and holds a weak reference to the owner, the last array of the `base` chain, which checks it on every hit.
+Only arrays over a buffer that is read-only itself, like `bytes` or a read-only `mmap`, are cached:
+an array owning its memory can be made writeable again, changed and frozen again.
+Entries go when their owner is garbage-collected.
+'''
+from threading import RLock
+from typing import Any, Hashable
+from weakref import ref
+
+import numpy as np
+
+from .reductions import MinMax
+
+
+MAX_ENTRIES = 4096  # the oldest entries are dropped past this, e.g. many slices of one frozen array
+
+_entries: dict[Hashable, tuple[int, MinMax]] = {}  # by key, with the `id` of the owner
+_owners: dict[int, tuple[ref, set[Hashable]]] = {}  # the owner and the keys of its entries, by `id`
+_lock = RLock()  # `_evict` runs from the garbage collector, also while `store` holds it
+
+
+def _frozen_owner(value: np.ndarray) -> np.ndarray | None:
+    '''
+    The array wrapping the read-only buffer `value` views, None when some array of its chain is writeable
+    or owns its memory, which can be made writeable again.
+    '''
+    owner = value
+    while True:
+        if owner.flags.writeable:
+            return None
+        base = owner.base
+        if base is None:
+            return None
+        if not isinstance(base, np.ndarray):
+            try:
+                with memoryview(base) as view:  # `bytes`, a read-only `mmap`, ...
+                    return owner if view.readonly else None
+            except TypeError:
+                return None
+        owner = base
+
+
+def _key(value: np.ndarray, owner: np.ndarray) -> Hashable:
+    # reading the data pointer costs more than the rest of a lookup, the owner is known by its identity
+    if value is owner:
+        return None, id(owner), value.shape, value.strides, value.dtype
+    return value.__array_interface__['data'][0], value.shape, value.strides, value.dtype
+
+
+def _evict(owner_id: int) -> None:
+    with _lock:
+        _, keys = _owners.pop(owner_id, (None, ()))
+        for key in keys:
+            _entries.pop(key, None)
+
+
+def lookup(value: Any) -> tuple[Hashable, np.ndarray] | MinMax | None:
+    '''
+    The cached min / max of `value`, else a token to `store` it with once computed,
+    None when `value` is not a frozen numpy array.
+    '''
+    if not isinstance(value, np.ndarray):
+        return None
+    owner = _frozen_owner(value)
+    if owner is None:
+        return None
+    key = _key(value, owner)
+    entry = _entries.get(key)
+    if entry is not None:
+        owned = _owners.get(entry[0])
+        if owned is not None and owned[0]() is owner:  # not left by a collected owner at the same address
+            return entry[1]
+    return key, owner
+
+
+def store(token: tuple[Hashable, np.ndarray], result: MinMax) -> None:
+    key, owner = token
+    owner_id = id(owner)
+    with _lock:
+        owned = _owners.get(owner_id)
+        if owned is None or owned[0]() is not owner:
+            owned = _owners[owner_id] = (ref(owner, lambda _: _evict(owner_id)), set())
+        _entries[key] = (owner_id, result)
+        owned[1].add(key)
+        while len(_entries) > MAX_ENTRIES:
+            oldest = next(iter(_entries))
+            oldest_id, _ = _entries.pop(oldest)
+            owned = _owners.get(oldest_id)  # may just have been evicted
+            if owned is not None:
+                owned[1].discard(oldest)
+
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
+        _owners.clear()
@@ -0,0 +1,118 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, NamedTuple
+
+import numpy as np
+
+
+# blocks this size stay in L2 cache between the min and the max reduction,
+# so the data is streamed from memory only once.
+DEFAULT_BLOCK_BYTES = 1 << 19
+
+
+class MinMax(NamedTuple):
+    min: Any
+    max: Any
+    has_nan: bool  # NaNs are excluded from min / max
+    has_inf: bool
+
+
+def _block_minmax(block: np.ndarray) -> MinMax:
+    lo = block.min()
+    hi = block.max()
+    if lo != lo:  # min / max propagate NaN, only blocks with NaN pay the second reduction
+        lo = np.nanmin(block) if not np.isnan(block).all() else np.nan
+        hi = np.nanmax(block) if lo == lo else np.nan
+        return MinMax(lo, hi, True, bool(np.isinf(lo) or np.isinf(hi)))
+    return MinMax(lo, hi, False, bool(np.isinf(lo) or np.isinf(hi)))
+
+
+def merge(results: list[MinMax]) -> MinMax:
+    lows = [result.min for result in results if result.min == result.min]
+    highs = [result.max for result in results if result.max == result.max]
+    return MinMax(
+        min(lows) if lows else np.nan,
+        max(highs) if highs else np.nan,
+        any(result.has_nan for result in results),
+        any(result.has_inf for result in results),
+    )
+
+
+def flat_blocks(value: np.ndarray, block_bytes: int = DEFAULT_BLOCK_BYTES):
+    '''
+    Yield views of `value` holding about `block_bytes` each, without copying, 1-d for contiguous arrays.
+    Non-contiguous arrays are cut along their first axis into blocks of whole rows instead,
+    a row larger than a block is cut itself.
+    '''
+    if value.ndim <= 1 or value.flags.c_contiguous or value.flags.f_contiguous:
+        flat = value.reshape(-1) if value.ndim <= 1 else value.ravel(order='K')
+        step = max(1, block_bytes // max(1, value.itemsize))
+        for start in range(0, flat.size, step):
+            yield flat[start:start + step]
+        return
+    row_bytes = value.itemsize * (value.size // max(1, len(value)))
+    if row_bytes >= block_bytes:
+        for sub in value:
+            yield from flat_blocks(sub, block_bytes)
+        return
+    step = max(1, block_bytes // max(1, row_bytes))
+    for start in range(0, len(value), step):
+        yield value[start:start + step]
+
+
+def minmax(value: Any, block_bytes: int = DEFAULT_BLOCK_BYTES) -> MinMax:
+    '''
+    Minimum and maximum of a tensor-like object computed in one pass over its memory.
+    '''
+    if isinstance(value, np.ndarray):
+        if value.size == 0:
+            raise ValueError('zero-size tensor-like object has no minimum or maximum value')
+        if value.dtype.kind not in 'fc':  # no NaN or Inf in integer / bool arrays
+            if value.nbytes <= block_bytes:
+                return MinMax(value.min(), value.max(), False, False)
+            return merge([MinMax(block.min(), block.max(), False, False) for block in flat_blocks(value, block_bytes)])
+        if value.nbytes <= block_bytes:
+            return _block_minmax(value)
+        return merge([_block_minmax(block) for block in flat_blocks(value, block_bytes)])
+    aminmax = getattr(value, 'aminmax', None)  # torch.Tensor
+    if aminmax is not None:
+        lo, hi = aminmax()
+        lo, hi = lo.item(), hi.item()
+    else:
+        lo, hi = value.min(), value.max()
+    has_nan = lo != lo or hi != hi
+    return MinMax(lo, hi, bool(has_nan), bool(abs(lo) == float('inf') or abs(hi) == float('inf')))
+
+
+def chunked_minmax(
+    value: Any,
+    chunk_bytes: int,
+    workers: int = 1,
+    stop: Callable[[MinMax], bool] | None = None,
+) -> MinMax:
+    '''
+    `minmax` of an array too large for memory, e.g. a `np.memmap`.
+    Chunks of `chunk_bytes` are reduced by `workers` threads (NumPy releases the GIL),
+    at most `workers` chunks are in flight so extra memory stays around `workers * chunk_bytes`.
+    Stops at the first chunk for which `stop(result)` is true, the returned result includes it.
+    '''
+    if not isinstance(value, np.ndarray) or value.size == 0:
+        return minmax(value)
+    results: list[MinMax] = []
+    pending: deque[Future[MinMax]] = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def collect() -> bool:
+            result = pending.popleft().result()
+            results.append(result)
+            return stop is not None and stop(result)
+
+        stopped = False
+        for chunk in flat_blocks(value, chunk_bytes):
+            if len(pending) >= workers and (stopped := collect()):
+                break
+            pending.append(pool.submit(minmax, chunk))
+        while pending and not stopped:
+            stopped = collect()
+        for future in pending:
+            future.cancel()
+    return merge(results)
@@ -0,0 +1,91 @@
+'''
+Core schemas of annotated parameters, built once per distinct annotation and shared by every function using it.
+Validators are interned and keep no per-function state, so an equal annotation always validates the same way.
+'''
+from types import FunctionType
+from typing import Annotated, Any, Callable
+
+from pydantic import GetCoreSchemaHandler
+from pydantic_core import CoreSchema
+
+from .signature import validators_of
+
+
+_schemas: dict[Any, CoreSchema] = {}
+
+
+def _copy(schema: Any) -> Any:
+    # schemas are plain dicts and lists around functions and classes, which are shared
+    if isinstance(schema, dict):
+        return {key: _copy(value) for key, value in schema.items()}
+    if isinstance(schema, list):
+        return [_copy(item) for item in schema]
+    return schema
+
+
+def _inline(schema: Any, handler: GetCoreSchemaHandler, refs: tuple[str, ...] = ()) -> Any:
+    '''
+    `schema` with the definitions it refers to inlined, so it does not depend on the generator that built it.
+    Raise LookupError for recursive or unresolved definitions, such schemas are not shared.
+    '''
+    if isinstance(schema, list):
+        return [_inline(item, handler, refs) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    if schema.get('type') == 'definition-ref':
+        ref = schema['schema_ref']
+        if ref in refs:
+            raise LookupError(f'recursive definition {ref}')
+        resolved = {key: value for key, value in handler.resolve_ref_schema(schema).items() if key != 'ref'}  # type: ignore
+        return _inline(resolved, handler, (*refs, ref))
+    return {key: _inline(value, handler, refs) for key, value in schema.items()}
+
+
+class _CachedSchema:
+    '''
+    Last metadata of an annotation, returns the schema of an equal annotation built before,
+    which skips generating the schemas of its type and of every validator in it.
+    '''
+    __slots__ = ('annotation',)
+
+    def __init__(self, annotation: Any) -> None:
+        self.annotation = annotation
+
+    def __get_pydantic_core_schema__(self, source_type: Any, handler: GetCoreSchemaHandler) -> CoreSchema:
+        schema = _schemas.get(self.annotation)
+        if schema is None:
+            schema = handler(source_type)
+            try:
+                _schemas[self.annotation] = _inline(schema, handler)
+            except LookupError:
+                pass
+            return schema
+        return _copy(schema)  # pydantic adds metadata to the schemas it is given
+
+
+def with_cached_schemas(func: Callable, hints: dict[str, Any]) -> Callable:
+    '''
+    A copy of the python function `func` whose parameters annotated with hirasawa validators
+    get their schemas from the shared cache, `func` itself when it has none or is not a python function.
+    '''
+    if not isinstance(func, FunctionType):
+        return func
+    annotations: dict[str, Any] = {}
+    for name, hint in hints.items():
+        if name == 'return' or not validators_of(hint):
+            continue
+        try:
+            hash(hint)
+        except TypeError:
+            continue
+        annotations[name] = Annotated[hint, _CachedSchema(hint)]
+    if not annotations:
+        return func
+    copy = FunctionType(func.__code__, func.__globals__, func.__name__, func.__defaults__, func.__closure__)
+    copy.__kwdefaults__ = func.__kwdefaults__
+    copy.__qualname__ = func.__qualname__
+    copy.__module__ = func.__module__
+    copy.__doc__ = func.__doc__
+    copy.__dict__.update(func.__dict__)  # `__wrapped__`, so the signature stays the one of the decorated function
+    copy.__annotations__ = func.__annotations__ | annotations
+    return copy
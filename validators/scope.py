@@ -0,0 +1,49 @@
+from contextvars import ContextVar
+
+from .shapecompiler import Bindings, Deferred
+
+
+class ValidationScope:
+    '''
+    Per-call state of a `hirasawa_validate` function.
+    `bindings` are the symbols bound by `tensorshape` so far,
+    `shapes_checked` is set when the shapes of this call are already known to be valid.
+    `check_data` is cleared when data validators like `tensorange` are sampled out of this call.
+    `validation_ns` is the time spent in validators, only counted when instrumentation is enabled.
+    `deferred` holds the shape equations with several unbound symbols, it is only set for functions
+    that have some, `pending_shapes` is the number of `tensorshape` checks left before they must be solved.
+    `data_deferred` is set when the validation plan runs the data validators itself, after every other check,
+    `n_args` is the number of positional arguments of the call, to locate their errors.
+    '''
+    __slots__ = (
+        'bindings', 'shapes_checked', 'check_data', 'validation_ns',
+        'deferred', 'pending_shapes', 'data_deferred', 'n_args',
+    )
+
+    def __init__(self, bindings: Bindings | None = None, shapes_checked: bool = False, check_data: bool = True) -> None:
+        self.bindings: Bindings = {} if bindings is None else bindings
+        self.shapes_checked = shapes_checked
+        self.check_data = check_data
+        self.validation_ns = 0
+        self.deferred: Deferred | None = None
+        self.pending_shapes = 0
+        self.data_deferred = False
+        self.n_args = 0
+
+
+# every call of a `hirasawa_validate` function gets its own scope,
+# threads and asyncio tasks each see their own context so they never share one.
+_scope_var: ContextVar[ValidationScope | None] = ContextVar('hirasawa_scope', default=None)
+
+
+def current_scope() -> ValidationScope | None:
+    return _scope_var.get()
+
+
+def current_bindings() -> Bindings | None:
+    '''
+    Symbol bindings of the innermost validating call, e.g. `{'W': 3, 'H': 4}`.
+    None when called outside of a `hirasawa_validate` function.
+    '''
+    scope = _scope_var.get()
+    return None if scope is None else scope.bindings
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Hashable, NamedTuple
+
+from .shapecompiler import Bindings
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class ShapeCache[V = Bindings]:
+    '''
+    Bounded LRU mapping from the shapes of a call to the bindings they resolved to.
+    Only shapes that passed validation are stored.
+    '''
+    def __init__(self, maxsize: int) -> None:
+        if maxsize <= 0:
+            raise ValueError(f'maxsize of shape cache must be positive, got {maxsize}')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, V] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> V | None:
+        with self._lock:
+            bindings = self._data.get(key)
+            if bindings is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return bindings
+
+    def put(self, key: Hashable, value: V) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class ShapeCounter(ShapeCache[int]):
+    '''
+    Bounded LRU count of the calls of every shape signature, for `hirasawa_validate(first_n=...)`.
+    A signature dropped for newer ones counts from zero again.
+    '''
+    def count(self, key: Hashable) -> int:
+        '''
+        Count one more call of `key`, returns how many came before it.
+        '''
+        with self._lock:
+            count = self._data.get(key, 0)
+            self._data[key] = count + 1
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return count
@@ -0,0 +1,494 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from fractions import Fraction
+import math
+import sys
+from typing import TYPE_CHECKING, Any, Callable, Literal, override
+
+if TYPE_CHECKING:
+    from sympy import Expr
+
+
+type Bindings = dict[str, int]
+type DimSpec = int | Literal['*'] | slice | Expr
+
+
+class _Form(ABC):
+    '''
+    A size expression lowered to plain python arithmetic.
+    `symbols` are the names the expression depends on.
+    '''
+    symbols: tuple[str, ...]
+    text: str
+
+    @abstractmethod
+    def value(self, bindings: Bindings) -> Fraction | int | None:
+        '''
+        Evaluate the expression, None if any symbol is still unbound.
+        '''
+
+    @abstractmethod
+    def assign(self, bindings: Bindings, size: int, deferred: Deferred | None = None) -> None:
+        '''
+        Check `expr == size`, solving for the only unbound symbol if there is one.
+        With more unbound symbols the equation is added to `deferred`, or rejected without it.
+        '''
+
+    def unbound(self, bindings: Bindings) -> list[str]:
+        return [name for name in self.symbols if name not in bindings]
+
+
+class _LinearForm(_Form):
+    '''
+    `(sum(coeff * symbol) + const) / den` with integer coeffs, so the common case
+    of integer coefficients never leaves python int arithmetic.
+    '''
+    def __init__(self, terms: dict[str, Fraction], const: Fraction, text: str) -> None:
+        den = math.lcm(const.denominator, *(coeff.denominator for coeff in terms.values()))
+        self.terms = tuple(sorted((name, int(coeff * den)) for name, coeff in terms.items()))
+        self.symbols = tuple(name for name, _ in self.terms)
+        self.const = int(const * den)
+        self.den = den
+        self.text = text
+        self._single = self.terms[0] if len(self.terms) == 1 else None  # `W`, `2*W + 1`, ...
+
+    @override
+    def value(self, bindings: Bindings) -> Fraction | int | None:
+        total = self.const
+        for name, coeff in self.terms:
+            if name not in bindings:
+                return None
+            total += coeff * bindings[name]
+        return total if self.den == 1 else Fraction(total, self.den)
+
+    @override
+    def assign(self, bindings: Bindings, size: int, deferred: Deferred | None = None) -> None:
+        residual = size * self.den - self.const
+        if self._single is not None:
+            name, coeff = self._single
+            bound = bindings.get(name)
+            if bound is None:
+                solution, remainder = divmod(residual, coeff)
+                if remainder != 0 or solution < 0:
+                    raise ValueError(f'{self.text} = {size} has no non-negative integer solution for {name}')
+                bindings[name] = solution
+                if deferred:
+                    deferred.resolve(bindings)
+            elif coeff * bound != residual:
+                raise ValueError(f'must have size {_fmt(Fraction(coeff * bound + self.const, self.den))} (symbol "{self.text}"), you provide {size}')
+            return
+        unbound: list[tuple[str, int]] = []
+        for name, coeff in self.terms:
+            if name in bindings:
+                residual -= coeff * bindings[name]
+            else:
+                unbound.append((name, coeff))
+        if len(unbound) == 0:
+            if residual != 0:
+                raise ValueError(f'must have size {_fmt(Fraction(size * self.den - residual, self.den))} (symbol "{self.text}"), you provide {size}')
+            return
+        if len(unbound) > 1:
+            if deferred is None:
+                raise ValueError(f'Error expresion {self.text} (To many unsolved symbols: {[name for name, _ in unbound]})')
+            deferred.add_linear(dict(unbound), residual, f'{self.text} = {size}', bindings)
+            return
+        name, coeff = unbound[0]
+        solution, remainder = divmod(residual, coeff)
+        if remainder != 0 or solution < 0:
+            raise ValueError(f'{self.text} = {size} has no non-negative integer solution for {name}')
+        bindings[name] = solution
+        if deferred:
+            deferred.resolve(bindings)
+
+
+class _CallableForm(_Form):
+    '''
+    Fallback for non-linear expressions such as `W*H` or `W**2`.
+    sympy is only used here at compile time, the lambdified functions are plain python.
+    '''
+    def __init__(self, expr: Expr) -> None:
+        import sympy as sp
+        symbols = sorted(expr.free_symbols, key=str)
+        size = sp.Dummy('size', integer=True, nonnegative=True)
+        self.symbols = tuple(str(symbol) for symbol in symbols)
+        self.text = str(expr)
+        self._func: Callable[..., Any] = sp.lambdify(symbols, expr, modules='math')
+        self._solvers: dict[str, list[Callable[..., Any]]] = {}
+        for symbol in symbols:
+            others = [other for other in symbols if other != symbol]
+            try:
+                solutions = sp.solve(expr - size, symbol)
+            except NotImplementedError:
+                continue
+            self._solvers[str(symbol)] = [
+                sp.lambdify([*others, size], solution, modules='cmath')
+                for solution in solutions
+            ]
+
+    def __getstate__(self) -> dict[str, Any]:
+        # the lambdified functions travel as source, rebuilding them needs no sympy
+        return {
+            'symbols': self.symbols,
+            'text': self.text,
+            '_func': _function_source(self._func),
+            '_solvers': {name: [_function_source(solver) for solver in solvers] for name, solvers in self._solvers.items()},
+        }
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.symbols = state['symbols']
+        self.text = state['text']
+        self._func = _function_of(*state['_func'])
+        self._solvers = {name: [_function_of(*source) for source in sources] for name, sources in state['_solvers'].items()}
+
+    @override
+    def value(self, bindings: Bindings) -> Fraction | None:
+        if self.unbound(bindings):
+            return None
+        return _to_fraction(self._func(*(bindings[name] for name in self.symbols)))
+
+    @override
+    def assign(self, bindings: Bindings, size: int, deferred: Deferred | None = None) -> None:
+        unbound = self.unbound(bindings)
+        if len(unbound) == 0:
+            actual = self.value(bindings)
+            if actual != size:
+                raise ValueError(f'must have size {_fmt(actual)} (symbol "{self.text}"), you provide {size}')
+            return
+        if len(unbound) > 1:
+            if deferred is None:
+                raise ValueError(f'Error expresion {self.text} (To many unsolved symbols: {unbound})')
+            deferred.add_form(self, size)
+            return
+        name = unbound[0]
+        others = [bindings[other] for other in self.symbols if other != name]
+        for solver in self._solvers.get(name, []):
+            candidate = _to_fraction(solver(*others, size))
+            if candidate is None or candidate < 0 or candidate.denominator != 1:
+                continue
+            # the solvers compute in floats, which round large sizes
+            values = [int(candidate) if other == name else bindings[other] for other in self.symbols]
+            if _to_fraction(self._func(*values)) == size:
+                bindings[name] = int(candidate)
+                if deferred:
+                    deferred.resolve(bindings)
+                return
+        raise ValueError(f'{self.text} = {size} has no non-negative integer solution for {name}')
+
+
+def _function_source(func: Callable[..., Any]) -> tuple[str, dict[str, Any]]:
+    '''
+    Source of a lambdified function and the globals it uses, like `sqrt` of `math`, which pickle by name.
+    '''
+    import inspect
+    namespace = {name: func.__globals__[name] for name in func.__code__.co_names if name in func.__globals__}
+    return inspect.getsource(func), namespace
+
+
+def _function_of(source: str, namespace: dict[str, Any]) -> Callable[..., Any]:
+    namespace = dict(namespace)
+    exec(source, namespace)
+    return namespace[source[4:source.index('(')]]  # `def <name>(...`
+
+
+class _Equation:
+    '''
+    `sum(coeff * symbol) == rhs` over the symbols that were unbound when it was deferred.
+    '''
+    __slots__ = ('terms', 'rhs', 'text')
+
+    def __init__(self, terms: dict[str, int], rhs: int, text: str) -> None:
+        self.terms = terms
+        self.rhs = rhs
+        self.text = text
+
+
+class Deferred:
+    '''
+    Constraints that had more than one unbound symbol when they were checked, e.g. `X + Y`
+    in `tensorshape[X + Y, X]`. Linear ones with a single unbound symbol left are solved
+    in integers, the rest together by exact rational Gauss-Jordan elimination.
+    Non-linear ones are re-checked once at most one of their symbols is unbound.
+    '''
+    __slots__ = ('equations', 'forms')
+
+    def __init__(self) -> None:
+        self.equations: list[_Equation] = []
+        self.forms: list[tuple[_Form, int]] = []
+
+    def __bool__(self) -> bool:
+        return bool(self.equations or self.forms)
+
+    def add_linear(self, terms: dict[str, int], rhs: int, text: str, bindings: Bindings) -> None:
+        self.equations.append(_Equation(terms, rhs, text))
+        if len(self.equations) > 1:  # a single equation with several unknowns determines nothing
+            self.resolve(bindings)
+
+    def add_form(self, form: _Form, size: int) -> None:
+        self.forms.append((form, size))
+
+    def _substitute(self, bindings: Bindings) -> None:
+        equations = []
+        for equation in self.equations:
+            rhs = equation.rhs
+            terms = {}
+            for name, coeff in equation.terms.items():
+                if name in bindings:
+                    rhs -= coeff * bindings[name]
+                else:
+                    terms[name] = coeff
+            if terms:
+                equations.append(_Equation(terms, rhs, equation.text))
+            elif rhs != 0:
+                values = ', '.join(f'{name} = {bindings[name]}' for name in equation.terms)
+                raise ValueError(f'is inconsistent with {equation.text}, which does not hold for {values}')
+        self.equations = equations
+
+    def _eliminate(self) -> dict[str, Fraction]:
+        '''
+        Reduced row echelon form of the equations, returns the symbols it determines.
+        '''
+        names = sorted({name for equation in self.equations for name in equation.terms})
+        rows = [[Fraction(equation.terms.get(name, 0)) for name in names] + [Fraction(equation.rhs)] for equation in self.equations]
+        pivot_row = 0
+        pivots: list[tuple[int, int]] = []
+        for col in range(len(names)):
+            pivot = next((r for r in range(pivot_row, len(rows)) if rows[r][col] != 0), None)
+            if pivot is None:
+                continue
+            rows[pivot_row], rows[pivot] = rows[pivot], rows[pivot_row]
+            lead = rows[pivot_row][col]
+            rows[pivot_row] = [value / lead for value in rows[pivot_row]]
+            for r in range(len(rows)):
+                if r != pivot_row and rows[r][col] != 0:
+                    factor = rows[r][col]
+                    rows[r] = [a - factor * b for a, b in zip(rows[r], rows[pivot_row])]
+            pivots.append((pivot_row, col))
+            pivot_row += 1
+        for row in rows[pivot_row:]:
+            if row[-1] != 0:
+                raise ValueError(f'is inconsistent with {", ".join(equation.text for equation in self.equations)}, which have no common solution')
+        determined = {}
+        for r, col in pivots:
+            if all(rows[r][c] == 0 for c in range(len(names)) if c != col):
+                determined[names[col]] = rows[r][-1]
+        return determined
+
+    def resolve(self, bindings: Bindings) -> None:
+        '''
+        Bind every symbol the deferred constraints determine, raise ValueError on contradictions.
+        '''
+        while True:
+            progress = False
+            forms = self.forms
+            self.forms = []
+            for form, size in forms:
+                unbound = form.unbound(bindings)
+                if len(unbound) <= 1:
+                    form.assign(bindings, size)
+                    progress = progress or bool(unbound)
+                else:
+                    self.forms.append((form, size))
+            self._substitute(bindings)
+            for equation in self.equations:
+                if len(equation.terms) == 1 and not bindings.keys() & equation.terms:
+                    (name, coeff), = equation.terms.items()
+                    solution, remainder = divmod(equation.rhs, coeff)
+                    if remainder != 0 or solution < 0:
+                        value = _fmt(Fraction(equation.rhs, coeff))
+                        raise ValueError(f'is inconsistent with {equation.text}, giving {name} = {value}, not a non-negative integer')
+                    bindings[name] = solution
+                    progress = True
+            if not progress and len(self.equations) > 1:
+                determined = self._eliminate()
+                texts = ', '.join(equation.text for equation in self.equations)
+                for name, fraction in determined.items():
+                    if fraction.denominator != 1 or fraction < 0:
+                        raise ValueError(f'is inconsistent with {texts}, giving {name} = {_fmt(fraction)}, not a non-negative integer')
+                    bindings[name] = fraction.numerator
+                progress = bool(determined)
+            if not progress:
+                return
+
+    def finish(self, bindings: Bindings) -> None:
+        '''
+        Called once every constraint of a call was checked, the symbols must be determined by then.
+        '''
+        self.resolve(bindings)
+        if self:
+            texts = [equation.text for equation in self.equations] + [f'{form.text} = {size}' for form, size in self.forms]
+            names = sorted(
+                {name for equation in self.equations for name in equation.terms}
+                | {name for form, _ in self.forms for name in form.unbound(bindings)}
+            )
+            raise ValueError(f'leaves {", ".join(names)} undetermined by {", ".join(texts)}')
+
+
+def _to_fraction(value: Any) -> Fraction | None:
+    if isinstance(value, complex):
+        if abs(value.imag) > 1e-9:
+            return None
+        value = value.real
+    if isinstance(value, float):
+        nearest = round(value)
+        if abs(value - nearest) < 1e-9:
+            return Fraction(nearest)
+        return Fraction(value)
+    return Fraction(value)
+
+
+def _fmt(value: Fraction | int | None) -> str:
+    if value is None:
+        return '?'
+    if isinstance(value, int) or value.denominator == 1:
+        return str(value.numerator)
+    return str(float(value))
+
+
+def compile_expr(expr: Expr) -> _Form:
+    '''
+    Lower a sympy expression to a `_LinearForm` when possible, `_CallableForm` otherwise.
+    '''
+    import sympy as sp
+    expr = sp.sympify(expr)
+    symbols = sorted(expr.free_symbols, key=str)
+    try:
+        poly = sp.Poly(expr, *symbols) if symbols else None
+    except sp.PolynomialError:
+        poly = None
+    if not symbols and expr.is_Rational:
+        return _LinearForm({}, Fraction(int(expr.p), int(expr.q)), str(expr))
+    if poly is not None and poly.is_linear:
+        coeffs = [poly.coeff_monomial(symbol) for symbol in symbols]
+        const = poly.coeff_monomial(1)
+        if all(coeff.is_Rational for coeff in [*coeffs, const]):
+            return _LinearForm(
+                {
+                    str(symbol): Fraction(int(coeff.p), int(coeff.q))
+                    for symbol, coeff in zip(symbols, coeffs)
+                    if coeff != 0
+                },
+                Fraction(int(const.p), int(const.q)),
+                str(expr),
+            )
+    return _CallableForm(expr)
+
+
+class DimConstraint(ABC):
+    '''
+    Compiled form of one entry of `tensorshape[...]`.
+    '''
+    symbols: tuple[str, ...] = ()
+
+    @abstractmethod
+    def check(self, bindings: Bindings, size: int, deferred: Deferred | None = None) -> None:
+        '''
+        Raise ValueError describing the mismatch, bind newly solved symbols into `bindings`.
+        Equations with several unbound symbols go to `deferred` when given.
+        '''
+
+
+class _AnyDim(DimConstraint):
+    @override
+    def check(self, bindings: Bindings, size: int, deferred: Deferred | None = None) -> None:
+        pass
+
+
+class _ConstDim(DimConstraint):
+    def __init__(self, size: int) -> None:
+        self.size = size
+
+    @override
+    def check(self, bindings: Bindings, size: int, deferred: Deferred | None = None) -> None:
+        if size != self.size:
+            raise ValueError(f'must have size {self.size}, you provide {size}')
+
+
+class _ExprDim(DimConstraint):
+    def __init__(self, form: _Form) -> None:
+        self.form = form
+        self.symbols = form.symbols
+
+    @override
+    def check(self, bindings: Bindings, size: int, deferred: Deferred | None = None) -> None:
+        self.form.assign(bindings, size, deferred)
+
+
+class _RangeDim(DimConstraint):
+    def __init__(self, start: int | _Form | None, stop: int | _Form | None) -> None:
+        self.start = start
+        self.stop = stop
+        self.symbols = tuple(sorted({
+            name
+            for bound in (start, stop) if isinstance(bound, _Form)
+            for name in bound.symbols
+        }))
+        self.text = f'{"" if start is None else _bound_text(start)}:{"" if stop is None else _bound_text(stop)}'
+
+    def _resolve(self, bound: int | _Form | None, bindings: Bindings, default: float) -> Fraction | int | float:
+        if bound is None:
+            return default
+        if isinstance(bound, int):
+            return bound
+        value = bound.value(bindings)
+        if value is None:
+            raise ValueError(f'Unsolved symbols: {bound.unbound(bindings)}')
+        return value
+
+    @override
+    def check(self, bindings: Bindings, size: int, deferred: Deferred | None = None) -> None:
+        min_val = self._resolve(self.start, bindings, 0)
+        max_val = self._resolve(self.stop, bindings, float('inf'))
+        if not min_val <= size < max_val:
+            lo = _fmt(min_val) if isinstance(min_val, (Fraction, int)) else str(min_val)
+            hi = _fmt(max_val) if isinstance(max_val, (Fraction, int)) else str(max_val)
+            suffix = f' (symbol "{self.text}")' if self.symbols else ''
+            raise ValueError(f'must have size in range [{lo}, {hi}){suffix}, you provide {size}')
+
+
+def _bound_text(bound: int | _Form) -> str:
+    return str(bound) if isinstance(bound, int) else bound.text
+
+
+def _is_expr(obj: Any) -> bool:
+    # a sympy expression can only exist once its user imported sympy, so sympy is never imported here
+    sympy = sys.modules.get('sympy')
+    return sympy is not None and isinstance(obj, sympy.Expr)
+
+
+def _compile_bound(bound: Any) -> int | _Form | None:
+    if bound is None:
+        return None
+    if _is_expr(bound):
+        form = compile_expr(bound)
+        if not form.symbols and isinstance(form, _LinearForm) and form.den == 1:
+            return form.const
+        return form
+    return bound.__index__()
+
+
+def compile_dim(spec: DimSpec) -> DimConstraint:
+    if isinstance(spec, str):
+        if spec == '*':
+            return _AnyDim()
+        raise TypeError(f'Invalid size mark: {spec!r}')
+    if isinstance(spec, slice):
+        if spec.step is not None:
+            raise TypeError(f'Size range does not support step: {spec}')
+        start = _compile_bound(spec.start)
+        stop = _compile_bound(spec.stop)
+        if start is None and stop is None:
+            return _AnyDim()
+        return _RangeDim(start, stop)
+    if _is_expr(spec):
+        form = compile_expr(spec)
+        if not form.symbols and isinstance(form, _LinearForm) and form.den == 1:
+            return _ConstDim(form.const)
+        return _ExprDim(form)
+    if isinstance(spec, bool):
+        raise TypeError(f'Invalid size type: {type(spec).__name__}')
+    return _ConstDim(spec.__index__())
+
+
+def compile_shape(size: tuple[DimSpec, ...]) -> tuple[DimConstraint, ...]:
+    return tuple(compile_dim(spec) for spec in size)
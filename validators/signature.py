@@ -0,0 +1,96 @@
+from functools import lru_cache
+from inspect import Parameter, Signature, signature
+from typing import Annotated, Any, Callable, get_args, get_origin, get_type_hints
+
+from pydantic_core import InitErrorDetails, PydanticCustomError
+
+from .base_validators import BaseValidator
+
+
+_MISSING: Any = object()
+
+
+class ParamSlot:
+    '''
+    Where one annotated parameter lives in `(*args, **kwargs)` of a call,
+    so its value can be fetched without `Signature.bind`.
+    '''
+    __slots__ = ('name', 'kind', 'position', 'validators')
+
+    def __init__(self, name: str, kind: Any, position: int | None, validators: tuple[BaseValidator, ...]) -> None:
+        self.name = name
+        self.kind = kind
+        self.position = position
+        self.validators = validators
+
+    def fetch(self, args: tuple, kwargs: dict) -> Any:
+        if self.position is not None and self.position < len(args):
+            return args[self.position]
+        return kwargs.get(self.name, _MISSING)
+
+    def loc(self, n_args: int) -> int | str:
+        # validate_call reports positional arguments by index, keyword arguments by name
+        return self.position if self.position is not None and self.position < n_args else self.name
+
+
+def error_details(e: Exception, loc: int | str, value: Any) -> InitErrorDetails:
+    '''
+    The `ValidationError` entry pydantic makes of an exception raised by a validator.
+    '''
+    if isinstance(e, PydanticCustomError):
+        return {'type': e, 'loc': (loc,), 'input': value}
+    if isinstance(e, ValueError):
+        return {'type': 'value_error', 'loc': (loc,), 'input': value, 'ctx': {'error': e}}
+    return {'type': 'assertion_error', 'loc': (loc,), 'input': value, 'ctx': {'error': e}}
+
+
+# decorating a function asks for its signature and type hints several times, they are computed once,
+# the results are shared so must not be modified
+@lru_cache(maxsize=16)
+def _signature(func: Callable) -> Signature:
+    return signature(func)
+
+
+@lru_cache(maxsize=16)
+def _annotations(func: Callable) -> dict[str, Any]:
+    try:
+        return get_type_hints(func, include_extras=True)
+    except Exception:
+        # unresolved forward reference, pydantic will report it, fall back to the raw annotations
+        return dict(getattr(func, '__annotations__', {}))
+
+
+def validators_of(annotation: Any) -> tuple[BaseValidator, ...]:
+    if get_origin(annotation) is not Annotated:
+        return ()
+    return tuple(meta for meta in annotation.__metadata__ if isinstance(meta, BaseValidator))
+
+
+def nested_validators(annotation: Any) -> tuple[BaseValidator, ...]:
+    '''
+    Validators inside `annotation` but not on its top level, e.g. in `list[Annotated[NDArray, v]]`
+    or `Annotated[NDArray, v] | None`, which pydantic runs on parts of the value.
+    '''
+    if get_origin(annotation) is Annotated:
+        annotation = annotation.__origin__
+    found: tuple[BaseValidator, ...] = ()
+    for arg in get_args(annotation):
+        found += validators_of(arg) + nested_validators(arg)
+    return found
+
+
+def param_slots(func: Callable) -> list[ParamSlot]:
+    '''
+    All parameters of `func` annotated with at least one hirasawa validator.
+    '''
+    hints = _annotations(func)
+    slots: list[ParamSlot] = []
+    position = 0
+    for param in _signature(func).parameters.values():
+        positional = param.kind in (Parameter.POSITIONAL_ONLY, Parameter.POSITIONAL_OR_KEYWORD)
+        validators = validators_of(hints.get(param.name))
+        if validators:
+            slots.append(ParamSlot(param.name, param.kind, position if positional else None, validators))
+        if positional:
+            position += 1
+    return slots
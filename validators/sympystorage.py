@@ -1,91 +1,77 @@
-import sympy as sp
 from sympy import Expr
 
+from fractions import Fraction
+from operator import index
 from functools import singledispatchmethod
-from typing import SupportsFloat
+from typing import SupportsFloat, SupportsIndex
 from validators._injectsympy import *  # dynanmically inject `__index__` method to sympy Expr
+from validators.shapecompiler import Bindings, Deferred, _Form, compile_dim, compile_expr
 
-type Number = SupportsFloat
+type Number = SupportsIndex | SupportsFloat
+type Size = int | Fraction  # exact values of solved expressions
+
+
+def _size(value: Number) -> int:
+    if isinstance(value, SupportsIndex):
+        try:
+            return index(value)  # ints stay exact however large
+        except TypeError:  # a sympy expression, see `_injectsympy`
+            pass
+    size = Fraction(float(value))
+    if size.denominator != 1:
+        raise ValueError(f"Invalid value, {value} is not an integer")
+    return size.numerator
 
 
 class SympyStorage:
-    def __init__(self, threshold: float = 1e-10) -> None:
-        self._namespace: dict[str, float] = {}
-        self._threshold = threshold
+    '''
+    Symbol values solved from `storage[expr] = size` assignments, as exact integers.
+    An expression with several unknown symbols, like `X + Y`, is kept until later assignments
+    determine them, `finish()` raises if some are still undetermined.
+    '''
+    def __init__(self) -> None:
+        self._namespace: Bindings = {}
+        self._deferred = Deferred()
+        self._forms: dict[Expr, _Form] = {}  # compiled once per distinct expression
         return super().__init__()
-    
+
+    def _form(self, expr: Expr) -> _Form:
+        form = self._forms.get(expr)
+        if form is None:
+            form = self._forms[expr] = compile_expr(expr)
+        return form
+
     @singledispatchmethod
     def __setitem__(self, key: int | Expr | slice, value: Number) -> None:
         raise TypeError(f"Invalid key type: {type(key).__name__}")
-        
+
     @__setitem__.register
     def _(self, key: int, value: Number) -> None:
         if key == value: return
         raise ValueError(f"Invalid value, {key} != {value}")
-        
+
     @__setitem__.register
     def _(self, key: Expr, value: Number) -> None:
-        value = float(value)
-        expr = sp.simplify(key - value).subs(self._namespace)
-        symbols = expr.free_symbols
-        if len(symbols) == 0:
-            ans = float(expr)
-            if abs(ans) < 1e-10: return
-            raise ValueError(f"{key} is already assigned to {value+ans}")
-        if len(symbols) == 1:
-            symbol = next(iter(symbols))
-            if symbol in self._namespace:
-                if self._namespace[str(symbol)] == float(expr): return
-                raise ValueError(f"{symbol} is already assigned to {self._namespace[str(symbol)]}")
-            solve = sp.solve(expr, symbol)
-            self._namespace[str(symbol)] = float(solve[0])
-        else:
-            raise ValueError(f"Error expresion {key} (To many unsolved symbols: {symbols})")
-    
-    
+        self._form(key).assign(self._namespace, _size(value), self._deferred)
+
     @__setitem__.register
     def _(self, key: slice, value: Number) -> None:
-        value = float(value)
-        start_obj = key.start
-        stop_obj = key.stop
-        if isinstance(start_obj, Expr):
-            expr = sp.simplify(start_obj <= value).subs(self._namespace)
-            if len(expr.free_symbols) != 0:
-                raise ValueError(f'Unsolved symbols: {expr.free_symbols}')
-            if bool(expr) == False:
-                raise ValueError(f"Invalid value, value you provide should greater equal than {start_obj}")
-        elif start_obj is not None:  # SupportsIndex
-            if not start_obj.__index__() <= value:
-                raise ValueError("Invalid value, value you provide should greater equal than {start_obj}")
-        else:  # None
-            if not 0 <= value:
-                raise ValueError("Invalid value")
-        if isinstance(stop_obj, Expr):
-            expr = sp.simplify(value < stop_obj).subs(self._namespace)
-            if len(expr.free_symbols) != 0:
-                raise ValueError(f'Unsolved symbols: {expr.free_symbols}')
-            if bool(expr) == False:
-                raise ValueError(f"Invalid value, value you provide should less than {stop_obj}")
-        elif stop_obj is not None:  # SupportsIndex
-            if not value < stop_obj.__index__():
-                raise ValueError(f"Invalid value, value you provide should less than {stop_obj}")
-        else:  # None
-            pass
-        
+        compile_dim(key).check(self._namespace, _size(value))
+
     @singledispatchmethod
-    def __getitem__(self, key: int | Expr | slice) -> Number | bool | None:
+    def __getitem__(self, key: int | Expr | slice) -> Size | bool | None:
         raise TypeError(f"Invalid key type: {type(key).__name__}")
-    
+
     @__getitem__.register
-    def _(self, key: int) -> Number:
+    def _(self, key: int) -> int:
         return key
-    
+
     @__getitem__.register
-    def _(self, key: Expr) -> Number | None:
-        ans = sp.simplify(key).subs(self._namespace)
-        if not ans.is_number:
+    def _(self, key: Expr) -> Size | None:
+        ans = self._form(key).value(self._namespace)
+        if ans is None:
             return None
-        return float(ans)
+        return ans.numerator if ans.denominator == 1 else ans
 
     @__getitem__.register
     def _(self, key: slice) -> bool:
@@ -105,10 +91,16 @@ class SympyStorage:
             max_val = stop_obj.__index__()
         if min_val is None or max_val is None:
             return True
-        min_val = float(min_val)
-        max_val = float(max_val)
         return min_val <= max_val
-    
+
+    def finish(self) -> None:
+        '''
+        Solve the remaining deferred expressions, raise ValueError when they are inconsistent
+        or leave symbols undetermined.
+        '''
+        self._deferred.finish(self._namespace)
+
     def clear(self) -> None:
         self._namespace.clear()
-    
+        self._deferred = Deferred()
+
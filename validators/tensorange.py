@@ -1,29 +1,130 @@
-from typing import override
+from typing import TYPE_CHECKING, override
 from pydantic_core import PydanticCustomError
 
-from .base_validators import SubscriptableValidator
+from .base_validators import SubscriptableValidator, _range_text
 
-from .protocols import TensorProtocol
+from .protocols import TensorProtocol, describe
+from .scope import _scope_var
+
+if TYPE_CHECKING:
+    from .reductions import MinMax
 
 
 class _TensorRangeValidator(SubscriptableValidator):
-    def __init__(self, _range: slice):
+    reads_data = True
+
+    def __init__(
+        self,
+        _range: slice,
+        allow_nan: bool = True,
+        allow_inf: bool = True,
+        block_bytes: int | None = None,
+        max_memory: int | None = None,
+        workers: int = 1,
+        cache: bool = False,
+    ):
+        '''
+        NaNs are skipped by the range check when `allow_nan`, rejected otherwise.
+        `tensorange(allow_nan=False, allow_inf=False)[0:1]` sets the policies.
+        `max_memory` enables the chunked mode for arrays larger than RAM (`np.memmap`):
+        `workers` threads reduce chunks of `max_memory // workers` bytes and stop at the first bad chunk.
+        `block_bytes` defaults to `reductions.DEFAULT_BLOCK_BYTES`, numpy is imported on the first validation.
+        A list or tuple of shards of one tensor is reduced shard by shard, stopping at the first one out of range.
+        `cache` reuses the min / max of numpy arrays over read-only buffers while they are alive, see `rangecache`,
+        so checking the same frozen array again costs O(1), whichever cached `tensorange` checked it first.
+        '''
+        if workers < 1:
+            raise ValueError(f'workers must be positive, got {workers}')
         self._min_val = float('-inf') if _range.start is None else _range.start
         self._max_val = float('inf') if _range.stop is None else _range.stop
+        self._allow_nan = allow_nan
+        self._allow_inf = allow_inf
+        self._block_bytes = block_bytes
+        self._max_memory = max_memory
+        self._workers = workers
+        self._cache = cache
+        self._range = _range
+
+    def __repr__(self) -> str:
+        return f'tensorange[{_range_text(self._range.start, self._range.stop)}]'
+
+    def _violates(self, result: 'MinMax') -> bool:
+        return (
+            (result.has_nan and not self._allow_nan)
+            or (result.has_inf and not self._allow_inf)
+            or result.min < self._min_val
+            or result.max >= self._max_val
+        )
         
+    @override
+    def skipped(self) -> bool:
+        scope = _scope_var.get()
+        return scope is not None and not scope.check_data
+
+    def _minmax(self, value: TensorProtocol) -> 'MinMax':
+        from . import reductions
+        cached = None
+        if self._cache:
+            from . import rangecache
+            cached = rangecache.lookup(value)
+        if isinstance(cached, reductions.MinMax):
+            return cached
+        block_bytes = reductions.DEFAULT_BLOCK_BYTES if self._block_bytes is None else self._block_bytes
+        if self._max_memory is None:
+            result = reductions.minmax(value, block_bytes)  # one pass, reused by every error of `validate`
+        else:
+            chunk_bytes = max(block_bytes, self._max_memory // self._workers)
+            result = reductions.chunked_minmax(value, chunk_bytes, self._workers, self._violates)
+        # a chunked pass stops at the first bad chunk, only a passing one covers the whole array
+        if cached is not None and (self._max_memory is None or not self._violates(result)):
+            rangecache.store(cached, result)
+        return result
+
     @override
     def validate(self, value: TensorProtocol) -> TensorProtocol:
-        if value.min() < self._min_val:
+        scope = _scope_var.get()
+        if scope is not None and not scope.check_data:  # sampled out by `hirasawa_validate(range_sample=...)`
+            return value
+        from . import reductions
+        if isinstance(value, (list, tuple)):  # shards of one tensor, reduced one by one
+            results = []
+            for shard in value:
+                if getattr(shard, 'size', None) == 0:  # a worker with no rows
+                    continue
+                results.append(self._minmax(shard))
+                if self._violates(results[-1]):  # the other shards can not make it pass
+                    break
+            if not results:
+                raise ValueError('shards with no element have no minimum or maximum value')
+            result = reductions.merge(results)
+        else:
+            result = self._minmax(value)
+        if not self._violates(result):
+            return value
+        details = {'value': describe(value), 'range': (self._min_val, self._max_val)}
+        if result.has_nan and not self._allow_nan:
+            raise PydanticCustomError(
+                'tensor-range-error',
+                'This tensor-like object should not contain NaN',
+                details
+            )
+        if result.has_inf and not self._allow_inf:
+            raise PydanticCustomError(
+                'tensor-range-error',
+                f'This tensor-like object should not contain Inf, but its actual value range is [{result.min}, {result.max}]',
+                details
+            )
+        if result.min < self._min_val:
             raise PydanticCustomError(
                 'tensor-range-error',
-                f'This tensor-like object should have a minimum value of {self._min_val}, but its actual minimum value is {value.min()}',
-                {'value': f'{type(value).__name__} {value.shape}', 'range': (self._min_val, self._max_val)}
+                f'This tensor-like object should have a minimum value of {self._min_val}, but its actual minimum value is {result.min}',
+                details
             )
-        if value.max() >= self._max_val:
+        if result.max >= self._max_val:
             raise PydanticCustomError(
                 'tensor-range-error',
-                f'This tensor-like object should have a maximum value of {self._max_val}, but its actual maximum value is {value.max()}',
-                {'value': f'{type(value).__name__} {value.shape}', 'range': (self._min_val, self._max_val)}
+                f'This tensor-like object should have a maximum value of {self._max_val}, but its actual maximum value is {result.max}',
+                details
             )
         return value
     
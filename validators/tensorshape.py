@@ -1,48 +1,181 @@
-from typing import override, Literal
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, Sequence, cast, override, Literal, get_origin
+
+from pydantic import ValidationError
 from pydantic_core import PydanticCustomError
-from sympy import Expr
-import sympy as sp
 
-from .base_validators import SubscriptableValidator
-from .protocols import TensorProtocol
-from .sympystorage import SympyStorage
+from .base_validators import _STREAMS, SubscriptableValidator, _range_text
+from .protocols import TensorProtocol, describe, shape_of
+from .shapecompiler import compile_shape, Bindings, Deferred, _RangeDim, _is_expr
+from .scope import _scope_var
+
+if TYPE_CHECKING:
+    from sympy import Expr
     
     
+def _plain(dim: Any) -> Any:
+    if isinstance(dim, slice):
+        return slice(_plain(dim.start), _plain(dim.stop))
+    return str(dim) if _is_expr(dim) else dim
+
+
 class _TensorShapeValidator(SubscriptableValidator):
-    def __init__(self, size: tuple[int | Literal['*'] | slice | Expr, ...]):
+    def __init__(self, size: tuple[int | Literal['*'] | slice | 'Expr', ...], split: int | None = None):
         '''
         int is regular constant size
         slice[int, int] is range
         str is special mark or expression.
-        when str is 'a', 'a' will be set to func.__validate_namespace__ as key.
-        the value of 'a' is the corresponding size of the tensor.
+        when it is a sympy symbol like `W`, 'W' will be bound in the bindings of current call.
+        the value of 'W' is the corresponding size of the tensor.
         slice ':' or string '*' means any size.
+        the sympy expressions are compiled once here, validating a call never touches sympy.
+        `tensorshape(split=0)[N, F]` also takes a list or tuple of shards of one logical tensor,
+        split along that dimension: the other dimensions must agree across shards,
+        the split one is the sum of theirs, and the shape is checked without concatenating them.
         '''
+        if not isinstance(size, tuple):
+            size = (size,)
+        if split is not None and not -len(size) <= split < len(size):
+            raise ValueError(f'split must be a dimension of the {len(size)} of the shape, got {split}')
         self._size = size
+        self._split = None if split is None else split % len(size)
+        self._constraints = compile_shape(size)
+        # some dimension has several symbols, e.g. `X + Y`, it may only be solvable after other dimensions
+        self._deferrable = any(
+            len(constraint.symbols) > 1 for constraint in self._constraints if not isinstance(constraint, _RangeDim)
+        )
+
+    @override
+    def validator_for(self, source_type: Any) -> Callable[[Any], Any]:
+        if get_origin(source_type) in _STREAMS:
+            return self.validate_stream  # an `Iterator[...]` / `Iterable[...]` of tensors
+        return self.validate
+
+    def __getstate__(self) -> dict[str, Any]:
+        # the compiled constraints do the checks, sympy expressions only travel as their text
+        state = self.__dict__.copy()
+        state['_size'] = tuple(_plain(dim) for dim in self._size)
+        return state
+
+    def __repr__(self) -> str:
+        dims = [_range_text(dim.start, dim.stop) if isinstance(dim, slice) else str(dim) for dim in self._size]
+        split = '' if self._split is None else f'(split={self._split})'
+        return f'tensorshape{split}[{", ".join(dims)}]'
     
+    def validate_stream(self, value: Iterable[TensorProtocol] | TensorProtocol) -> Iterable[TensorProtocol] | TensorProtocol:
+        '''
+        `validate` of an annotated iterable of tensors, which returns a lazily checked iterator, see `stream`.
+        '''
+        if shape_of(value) is not None:  # one tensor-like object, not a stream of them
+            return self.validate(cast(TensorProtocol, value))
+        scope = _scope_var.get()
+        if scope is not None and scope.deferred is not None:
+            scope.pending_shapes -= 1
+            if scope.pending_shapes <= 0:
+                try:
+                    scope.deferred.finish(scope.bindings)
+                except ValueError as e:
+                    raise PydanticCustomError('tensor-shape-mismatch', f'This call {e}')
+        return self.stream(value, {} if scope is None else scope.bindings)
+
     @override
     def validate(self, value: TensorProtocol) -> TensorProtocol:
-        if not isinstance(value, TensorProtocol):
-            raise TypeError(f'{self.source_type} is not a tensor-like type')
-        if value.ndim != len(self._size):
-            raise PydanticCustomError(
-                'tensor-shape-mismatch',
-                f'This tensor-like object must have {len(self._size)} dimensions, which shape is {value.shape}',
-                {'value': f'{type(value).__name__} {value.shape}', 'size': self._size}
-            )
-        sympy_storage: SympyStorage = getattr(self.validate_obj, '__sympy_storage__')
-        for i, (required_size, actual_size) in enumerate(zip(self._size, value.shape)):
-            if required_size == '*': continue
-            try:
-                sympy_storage[required_size] = actual_size
-            except Exception as e:
-                raise PydanticCustomError(
-                    'tensor-shape-mismatch',
-                    str(e),
-                    {'value': f'{type(value).__name__} {value.shape}', 'size': self._size}
-                )
+        scope = _scope_var.get()
+        if scope is None:  # not inside `hirasawa_validate`, symbols only need to agree within this tensor
+            bindings: Bindings = {}
+            deferred = Deferred() if self._deferrable else None
+        elif scope.shapes_checked:  # same shapes as a cached call that already passed
+            return value
+        else:
+            bindings = scope.bindings
+            deferred = scope.deferred
+        shape = self.shape_of(value)
+        if shape is None:
+            raise TypeError(f'{type(value).__name__} is not a tensor-like type')
+        self.check_shape(value, bindings, deferred, shape)
+        if deferred is not None:
+            if scope is not None:
+                scope.pending_shapes -= 1
+            if scope is None or scope.pending_shapes <= 0:  # the last shape of the call
+                try:
+                    deferred.finish(bindings)
+                except ValueError as e:
+                    raise self.mismatch(value, f'{"This tensor-like object" if scope is None else "This call"} {e}')
         return value
+
+    def stream(self, items: Iterable[TensorProtocol], bindings: Bindings) -> Iterator[TensorProtocol]:
+        '''
+        Check every item as it is pulled, in constant memory.
+        The symbols stay bound across the whole stream, use `'*'` for sizes that vary between items.
+        '''
+        for i, item in enumerate(items):
+            try:
+                if self.shape_of(item) is None:
+                    raise PydanticCustomError('tensor-shape-mismatch', f'The {i}-th item is not a tensor-like object')
+                self.check_shape(item, bindings)
+            except PydanticCustomError as e:
+                raise ValidationError.from_exception_data('ValidatorIterator', [{'type': e, 'loc': (i,), 'input': item}])
+            yield item
+
+    def shape_of(self, value: Any) -> tuple[int, ...] | None:
+        '''
+        The shape `value` is checked with, for a sequence of shards with `split` the shape of their concatenation,
+        read from the shards' shapes only. None when `value` has no shape,
+        PydanticCustomError when the shards do not make up one tensor.
+        '''
+        shape = shape_of(value)
+        if shape is not None or self._split is None or not isinstance(value, (list, tuple)):
+            return shape
+        if not value:
+            raise self.mismatch(value, 'This sequence of shards is empty')
+        split = self._split
+        shapes = [shape_of(shard) for shard in value]
+        first = shapes[0]
+        for i, shape in enumerate(shapes):
+            if shape is None:
+                raise self.mismatch(value, f'The {i}-th shard is not a tensor-like object')
+            if len(shape) != len(self._size):
+                raise self.mismatch(value, f'The {i}-th shard must have {len(self._size)} dimensions, which shape is {shape}')
+            for dim, (size, expected) in enumerate(zip(shape, first)):  # type: ignore
+                if dim != split and size != expected:
+                    raise self.mismatch(
+                        value,
+                        f'The {dim}-th dimension of the {i}-th shard is {size}, but {expected} in the 0-th shard, '
+                        f'shards may only differ in the {split}-th dimension'
+                    )
+        return (*first[:split], sum(shape[split] for shape in shapes), *first[split + 1:])  # type: ignore
+
+    def check_shape(
+        self,
+        value: TensorProtocol,
+        bindings: Bindings,
+        deferred: Deferred | None = None,
+        shape: tuple[int, ...] | None = None,
+    ) -> None:
+        '''
+        Raise PydanticCustomError unless the shape of `value` matches, binding new symbols into `bindings`.
+        '''
+        if shape is None:
+            shape = self.shape_of(value)
+        if len(shape) != len(self._size):  # type: ignore
+            raise self.mismatch(value, f'This tensor-like object must have {len(self._size)} dimensions, which shape is {shape}')
+        for i, (constraint, actual_size) in enumerate(zip(self._constraints, shape)):  # type: ignore
+            try:
+                constraint.check(bindings, actual_size, deferred)
+            except ValueError as e:
+                raise self.mismatch(value, f'The {i}-th dimension of this tensor-like object {e}')
+
+    @override
+    def skipped(self) -> bool:
+        scope = _scope_var.get()
+        return scope is not None and scope.shapes_checked
+
+    def mismatch(self, value: TensorProtocol | Sequence[TensorProtocol], message: str) -> PydanticCustomError:
+        return PydanticCustomError(
+            'tensor-shape-mismatch',
+            message,
+            {'value': describe(value), 'size': self._size}
+        )
             
     
     
-tensorshape = _TensorShapeValidator.subscriptable()
\ No newline at end of file
+tensorshape = _TensorShapeValidator.subscriptable()
@@ -0,0 +1,124 @@
+from typing import Any, Literal, cast, override
+
+from pydantic_core import PydanticCustomError
+
+from .base_validators import _range_text
+from .protocols import TensorProtocol, shape_of
+from .tensorange import _TensorRangeValidator
+from .tensorshape import _TensorShapeValidator
+
+
+def _address(value: Any) -> int | None:
+    interface = getattr(value, '__array_interface__', None)  # numpy
+    if interface is not None:
+        return interface['data'][0]
+    data_ptr = getattr(value, 'data_ptr', None)  # torch.Tensor
+    return None if data_ptr is None else data_ptr()
+
+
+def _contiguous(value: Any, order: Literal['C', 'F']) -> bool:
+    flags = getattr(value, 'flags', None)
+    if flags is not None:
+        return flags.c_contiguous if order == 'C' else flags.f_contiguous
+    is_contiguous = getattr(value, 'is_contiguous', None)  # torch only knows the C layout
+    return order == 'C' and is_contiguous is not None and is_contiguous()
+
+
+def _aligned_copy(value: Any, order: Literal['C', 'F'], align: int) -> Any:
+    import numpy as np
+    buffer = np.empty(value.nbytes + align, np.uint8)
+    offset = -buffer.ctypes.data % align
+    copy = buffer[offset:offset + value.nbytes].view(value.dtype).reshape(value.shape, order=order)
+    np.copyto(copy, value)
+    return copy
+
+
+class _TensorSpecValidator(_TensorShapeValidator):
+    def __init__(
+        self,
+        size: tuple,
+        dtype: Any = None,
+        order: Literal['C', 'F'] | None = None,
+        align: int | None = None,
+        range: slice | None = None,
+        allow_nan: bool = True,
+        allow_inf: bool = True,
+        convert: bool = False,
+    ):
+        '''
+        `tensorshape`, dtype, layout and `tensorange` checks of one argument in a single validator,
+        e.g. `tensorspec(dtype=np.float32, order='C', align=64, range=slice(0, 1))[B, W, H]`.
+        `order` requires a C or F contiguous layout, `align` the byte alignment of the data.
+        With `convert`, a numpy array failing only the layout is copied to one that passes,
+        so the function body always gets a BLAS friendly array, other arrays are passed as is.
+        The shape is checked with the symbols of the call, like `tensorshape`,
+        the value range is the only check reading the data, in one pass, last in the call.
+        '''
+        if order not in (None, 'C', 'F'):
+            raise ValueError(f"order must be 'C', 'F' or None, got {order!r}")
+        if align is not None and (align < 1 or align & (align - 1)):
+            raise ValueError(f'align must be a power of two, got {align}')
+        super().__init__(size)
+        self._dtype = dtype
+        self._order = order
+        self._align = align
+        self._convert = convert
+        self._values = None if range is None else _TensorRangeValidator(range, allow_nan, allow_inf)
+        self.reads_data = self._values is not None
+
+    def __repr__(self) -> str:
+        options = [
+            f'{name}={value}' for name, value in (
+                ('dtype', None if self._dtype is None else getattr(self._dtype, '__name__', self._dtype)),
+                ('order', self._order),
+                ('align', self._align),
+                ('range', None if self._values is None else _range_text(self._values._range.start, self._values._range.stop)),
+            ) if value is not None
+        ]
+        return f'tensorspec({", ".join(options)}){super().__repr__()[len("tensorshape"):]}'
+
+    @override
+    def validate(self, value: TensorProtocol) -> TensorProtocol:
+        value = super().validate(value)  # the shape, with the symbols of the call
+        value = self.check_layout(value)
+        if self._values is not None:
+            self._values.validate(value)  # skipped while the validation plan defers data validators
+        return value
+
+    @override
+    def skipped(self) -> bool:
+        return False  # the dtype and layout are checked even when the shapes are known
+
+    def check_layout(self, value: TensorProtocol) -> TensorProtocol:
+        '''
+        Check the dtype, order and alignment of `value`, the copy fixing its layout with `convert`.
+        '''
+        dtype = getattr(value, 'dtype', None)  # buffer objects have none
+        if self._dtype is not None and dtype != self._dtype:
+            raise PydanticCustomError(
+                'tensor-dtype-mismatch',
+                f'This tensor-like object must have dtype {getattr(self._dtype, "__name__", self._dtype)}, got {dtype}',
+                {'value': f'{type(value).__name__} {shape_of(value)}', 'dtype': str(self._dtype)}
+            )
+        problem = None
+        if self._order is not None and not _contiguous(value, self._order):
+            problem = f'must be {self._order} contiguous'
+        elif self._align is not None and (address := _address(value)) is not None and address % self._align:
+            problem = f'must be aligned to {self._align} bytes, its data starts at {address:#x}'
+        if problem is None:
+            return value
+        if self._convert and hasattr(value, '__array_interface__'):
+            order = self._order or 'C'
+            if self._align is None:
+                import numpy as np
+                # numpy's dtype is not a type, the copy is tensor-like all the same
+                return cast(TensorProtocol, np.ascontiguousarray(value) if order == 'C' else np.asfortranarray(value))
+            return _aligned_copy(value, order, self._align)
+        raise PydanticCustomError(
+            'tensor-layout-error',
+            f'This tensor-like object {problem}',
+            {'value': f'{type(value).__name__} {shape_of(value)}'}
+        )
+
+
+tensorspec = _TensorSpecValidator.subscriptable()